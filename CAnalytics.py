@@ -0,0 +1,135 @@
+import sys
+import datetime
+from array import array
+import numpy as np
+import CPunchcards
+from utils import *
+
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+#-------------------------------------------------------------------------------
+def datesToDays(dates):
+    """Convert an array of YYYYMMDD integers into days since 1970-01-01"""
+    years = (dates // 10000 - 1970).astype('datetime64[Y]')
+    months = (dates // 100 % 100 - 1).astype('timedelta64[M]')
+    days = (dates % 100 - 1).astype('timedelta64[D]')
+    return ((years + months) + days).astype('datetime64[D]').astype(np.int64)
+
+#-------------------------------------------------------------------------------
+class CAnalytics:
+    """Punch ledger (the current punchcards plus history) loaded once into columnar arrays, one entry per punch:
+
+        date    YYYYMMDD as an integer
+        player  index into self.playerIDs / self.playerNames (the card owner)
+        card    index of the punchcard the punch is on
+
+    startdate/enddate (YYYYMMDD) only limit which history cards are read; every query takes its own range.
+    """
+    def __init__(self, punchcards=None, startdate='', enddate=''):
+        self.path = getHockeyPath()
+        self.punchcards = punchcards if punchcards is not None else CPunchcards.CPunchcards()
+        self._loadLedger(startdate, enddate)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def _loadLedger(self, startdate, enddate):
+        # the session's current cards (journal already applied) plus the history cards played in the range
+        rows = self.punchcards.punchcards + self.punchcards._loadHistory(startdate, enddate)
+        slotCount = self.punchcards.totalSlotCount
+
+        playerCodes = {}
+        self.playerIDs = []
+        self.playerNames = []
+        cardPlayer = np.empty(len(rows), dtype=np.int32)
+        allDates = array('l')
+        for cardIdx, row in enumerate(rows):
+            code = playerCodes.get(row.hockeyID)
+            if code is None:
+                code = playerCodes[row.hockeyID] = len(self.playerIDs)
+                self.playerIDs.append(row.hockeyID)
+                self.playerNames.append(row.meetupName)
+            cardPlayer[cardIdx] = code
+            allDates.extend(row.dates)
+
+        # empty, 'NULL' and unreadable slots are all <= 0
+        dates = np.frombuffer(allDates, dtype=np.dtype(allDates.typecode)).astype(np.int64)
+        punched = dates > 0
+        self.date = dates[punched]
+        self.card = np.repeat(np.arange(len(rows), dtype=np.int32), slotCount)[punched]
+        self.player = cardPlayer[self.card]
+
+    #-------------------------------------------------------------------------------
+    def _select(self, startdate='', enddate=''):
+        mask = np.ones(len(self.date), dtype=bool)
+        if len(startdate) > 0:
+            mask &= self.date >= int(startdate)
+        if len(enddate) > 0:
+            mask &= self.date <= int(enddate)
+        return mask
+
+    #-------------------------------------------------------------------------------
+    def gamesPerPlayer(self, startdate='', enddate=''):
+        """Return {hockeyID: {'name': meetupName, 'count': games}}, most games first"""
+        counts = np.bincount(self.player[self._select(startdate, enddate)], minlength=len(self.playerIDs))
+        order = np.argsort(-counts, kind='stable')
+        return {self.playerIDs[i]: {'name': self.playerNames[i], 'count': int(counts[i])} for i in order if counts[i] > 0}
+
+    #-------------------------------------------------------------------------------
+    def gamesPerMonth(self, startdate='', enddate=''):
+        """Return {YYYYMM: punches used} in month order"""
+        months, counts = np.unique(self.date[self._select(startdate, enddate)] // 100, return_counts=True)
+        return {str(month): int(count) for month, count in zip(months, counts)}
+
+    #-------------------------------------------------------------------------------
+    def gamesPerWeekday(self, startdate='', enddate=''):
+        """Return {weekday name: punches used}, Monday first"""
+        days = datesToDays(self.date[self._select(startdate, enddate)])
+        counts = np.bincount((days + 3) % 7, minlength=7)      # 1970-01-01 was a Thursday
+        return {WEEKDAY_NAMES[i]: int(counts[i]) for i in range(7)}
+
+    #-------------------------------------------------------------------------------
+    def gameDates(self, startdate='', enddate=''):
+        """Return the sorted list of distinct dates (YYYYMMDD) on which any punch was used"""
+        return [str(date) for date in np.unique(self.date[self._select(startdate, enddate)])]
+
+    #-------------------------------------------------------------------------------
+    def totals(self, startdate='', enddate=''):
+        mask = self._select(startdate, enddate)
+        return {'punches': int(mask.sum()),
+                'games': int(len(np.unique(self.date[mask]))),
+                'players': int(len(np.unique(self.player[mask]))),
+                'cards': int(len(np.unique(self.card[mask])))}
+
+    #-------------------------------------------------------------------------------
+    def printReport(self, startdate, enddate):
+        totals = self.totals(startdate, enddate)
+        print(f"\nTotal games played between {startdate} and {enddate} is {totals['games']}")
+        print(f"{totals['punches']} punches used by {totals['players']} players on {totals['cards']} punchcards")
+        print("\nGames per player")
+        for player in self.gamesPerPlayer(startdate, enddate).values():
+            print(player['name'], player['count'])
+        print("\nPunches per month")
+        for month, count in self.gamesPerMonth(startdate, enddate).items():
+            print(month, count)
+        print("\nPunches per weekday")
+        for weekday, count in self.gamesPerWeekday(startdate, enddate).items():
+            if count > 0:
+                print(weekday, count)
+        return
+
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    year = datetime.date.today().year
+    startdate = sys.argv[1] if len(sys.argv) > 1 else f"{year}0101"
+    enddate = sys.argv[2] if len(sys.argv) > 2 else f"{year}1231"
+    analytics = CAnalytics(startdate=startdate, enddate=enddate)
+    analytics.printReport(startdate, enddate)
+
+    print("all done")
@@ -0,0 +1,213 @@
+import os
+import csv
+import json
+import CSession
+from CGameFile import CGameFile, earlyBirdCutoff, findGameFiles
+from CXref import normalizeMeetupID
+from utils import *
+
+ATTENDANCE_VERSION = 2
+MIN_FILES_FOR_POOL = 16         # starting worker processes costs more than parsing a handful of files
+
+#-------------------------------------------------------------------------------
+def parseGameFile(job):
+    """Read one game file. Returns (date, [[meetupID, meetupName, rsvpedOn, earlyBird], ...]), or (date, None) if the
+    file can't be read. Module level so a process pool can pickle it."""
+    date, filepath = job
+    try:
+        attendees = CGameFile(filepath).attendees()
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        print(f"ERROR 752: Could not read game file {os.path.basename(filepath)}: {e}")
+        return date, None
+    cutoff = earlyBirdCutoff(date)
+    rows = []
+    for attendee in attendees:
+        if len(attendee.meetupID) == 0:
+            continue
+        rsvpedOn = attendee.rsvpedOn
+        rows.append([normalizeMeetupID(attendee.meetupID), attendee.meetupName,
+                     rsvpedOn.isoformat() if rsvpedOn is not None else "",
+                     1 if rsvpedOn is not None and rsvpedOn.date() <= cutoff else 0])
+    return date, rows
+
+#-------------------------------------------------------------------------------
+class CAttendance:
+    """Who played on which date, from the game files in games/, for play histories and attendance/early bird trends.
+
+    The attendees read from each game file are kept in attendance.json with the file's size and modification time, so
+    only game files that are new or have changed since the last time are read. When there are many of them (a first
+    run over a multi-year archive) they're read in parallel by a process pool. Meetup IDs are turned into Hockey User
+    IDs (through meetup_roster.csv) when the index is loaded, so a player added to the cross reference later still gets
+    their earlier games.
+
+    games: date -> [[Meetup User ID (normalized), Meetup name, RSVP time (ISO, "" if unreadable), early bird 1/0], ...]
+    players: Hockey User ID -> sorted list of dates played
+    """
+    def __init__(self, session=None, workers=None):
+        self.path = getHockeyPath()
+        self.gamesPath = os.path.join(self.path, "games")
+        self.indexFilename = os.path.join(self.path, "attendance.json")
+        self.session = session if session is not None else CSession.CSession()
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.files = {}
+        self.games = {}
+        self.players = {}
+        self._loadIndex()
+        if self._refresh():
+            self._saveIndex()
+        self._buildPlayers()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def _loadIndex(self):
+        if not os.path.exists(self.indexFilename):
+            return
+        try:
+            countFileLoad("attendance.json")
+            with open(self.indexFilename, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+            if index.get("version") == ATTENDANCE_VERSION:
+                self.files, self.games = index["files"], index["games"]
+        except (ValueError, KeyError):
+            self.files, self.games = {}, {}
+
+    #-------------------------------------------------------------------------------
+    def _saveIndex(self):
+        try:
+            with open(self.indexFilename + ".tmp", 'w', encoding='utf-8') as file:
+                json.dump({"version": ATTENDANCE_VERSION, "files": self.files, "games": self.games}, file)
+            replaceFileAtomic(self.indexFilename + ".tmp", self.indexFilename)
+        except OSError as e:
+            # it'll be rebuilt from the game files next time
+            print(f"WARNING 751: Could not save attendance.json: {e}")
+
+    #-------------------------------------------------------------------------------
+    def _parse(self, jobs):
+        """Read the game files, in worker processes if there are enough of them. Returns {date: rows}."""
+        if len(jobs) < MIN_FILES_FOR_POOL or self.workers <= 1:
+            return dict(map(parseGameFile, jobs))
+        from concurrent.futures import ProcessPoolExecutor      # only needed for a big catch-up
+        chunksize = max(1, len(jobs) // (self.workers * 4))
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            return dict(pool.map(parseGameFile, jobs, chunksize=chunksize))
+
+    #-------------------------------------------------------------------------------
+    def _refresh(self):
+        """Read the game files that are new or changed since attendance.json was saved. Returns True if any were."""
+        changed = False
+        gameFiles = findGameFiles(self.gamesPath)
+        for date in [date for date in self.games if date not in gameFiles]:
+            del self.games[date]
+            self.files.pop(date, None)
+            changed = True
+        stale = sorted(date for date, (filename, signature) in gameFiles.items() if self.files.get(date) != [filename] + signature)
+        parsed = self._parse([(date, os.path.join(self.gamesPath, gameFiles[date][0])) for date in stale])
+        for date, attendees in parsed.items():
+            if attendees is None:
+                continue
+            self.games[date] = attendees
+            self.files[date] = [gameFiles[date][0]] + gameFiles[date][1]
+            changed = True
+        return changed
+
+    #-------------------------------------------------------------------------------
+    def getHockeyID(self, meetupID):
+        return self.session.xref.getHockeyID(meetupID)
+
+    #-------------------------------------------------------------------------------
+    def _buildPlayers(self):
+        self.players = {}
+        for date in sorted(self.games):
+            for meetupID, meetupName, rsvpedOn, earlyBird in self.games[date]:
+                self.players.setdefault(self.getHockeyID(meetupID), []).append(date)
+
+    #-------------------------------------------------------------------------------
+    def getPlayDates(self, hockeyID):
+        """Dates (YYYYMMDD) the player played, oldest first"""
+        return self.players.get(hockeyID, [])
+
+    #-------------------------------------------------------------------------------
+    def getAttendees(self, date):
+        """Hockey User IDs of the players at the game on date"""
+        return [self.getHockeyID(attendee[0]) for attendee in self.games.get(date, [])]
+
+    #-------------------------------------------------------------------------------
+    def getGameDates(self, startdate='', enddate=''):
+        return [date for date in sorted(self.games) if (len(startdate) == 0 or date >= startdate) and
+                                                       (len(enddate) == 0 or date <= enddate)]
+
+    #-------------------------------------------------------------------------------
+    def monthlyTrends(self, startdate='', enddate=''):
+        """Return {YYYYMM: [games, attendances, distinct players, early birds]}"""
+        months = {}
+        players = {}
+        for date in self.getGameDates(startdate, enddate):
+            counts = months.setdefault(date[:6], [0, 0, 0, 0])
+            counts[0] += 1
+            for meetupID, meetupName, rsvpedOn, earlyBird in self.games[date]:
+                counts[1] += 1
+                counts[3] += earlyBird
+                players.setdefault(date[:6], set()).add(self.getHockeyID(meetupID))
+        for month, counts in months.items():
+            counts[2] = len(players.get(month, ()))
+        return months
+
+    #-------------------------------------------------------------------------------
+    def earlyBirdRate(self, hockeyID='', startdate='', enddate=''):
+        """Fraction of sign ups (for one player, or everyone) that were early birds"""
+        signups = earlyBirds = 0
+        for date in self.getGameDates(startdate, enddate):
+            for meetupID, meetupName, rsvpedOn, earlyBird in self.games[date]:
+                if len(hockeyID) == 0 or self.getHockeyID(meetupID) == hockeyID:
+                    signups += 1
+                    earlyBirds += earlyBird
+        return earlyBirds / signups if signups > 0 else 0.0
+
+    #-------------------------------------------------------------------------------
+    def reconcile(self):
+        """Return ({Meetup ID: Meetup name} of attendees missing from meetup_roster.csv,
+                   {Hockey User ID: last date played} of attendees missing from roster.csv)"""
+        xref = self.session.xref
+        roster = self.session.roster.roster
+        unmatched, unknown = {}, {}
+        for date in sorted(self.games):
+            for meetupID, meetupName, rsvpedOn, earlyBird in self.games[date]:
+                if meetupID not in xref:
+                    unmatched[meetupID] = meetupName
+                elif self.getHockeyID(meetupID) not in roster:
+                    unknown[self.getHockeyID(meetupID)] = date
+        return unmatched, unknown
+
+    #-------------------------------------------------------------------------------
+    def printReport(self, startdate='', enddate=''):
+        print()
+        print("Month    Games  Attendances  Players  Early birds")
+        print("-----------------------------------------------")
+        for month, (games, attendances, players, earlyBirds) in self.monthlyTrends(startdate, enddate).items():
+            print(f"{month}  {games:6}  {attendances:11}  {players:7}  {100.0 * earlyBirds / max(attendances, 1):10.0f}%")
+        unmatched, unknown = self.reconcile()
+        if len(unmatched) > 0:
+            print()
+            print(f"{len(unmatched)} Meetup IDs are not in meetup_roster.csv (use menu item 6 to add them):")
+            for meetupID, meetupName in sorted(unmatched.items(), key=lambda item: item[1].upper()):
+                print("   ", meetupID, meetupName)
+        if len(unknown) > 0:
+            print()
+            print(f"{len(unknown)} Hockey User IDs in meetup_roster.csv are not in roster.csv:")
+            for hockeyID, date in sorted(unknown.items()):
+                print("   ", hockeyID, "last played", date)
+
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    attendance = CAttendance()
+    for date in attendance.getGameDates():
+        print(date, len(attendance.getAttendees(date)), "players")
+    attendance.printReport()
+    print("all done")
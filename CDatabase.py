@@ -0,0 +1,298 @@
+import os
+import sys
+import csv
+import json
+from CRecords import CPunchcardRecord, CRosterRecord, XREF_FILE_HEADER, DATE_NULL, encodeDate
+from utils import *
+
+ROSTER_COLUMNS = ", ".join(CRosterRecord.COLUMNS)
+PUNCHCARD_FIELDS = ("hockeyID", "meetupName", "altID", "altName", "status", "purchaseDate")     # punchcard columns 0-5
+
+# encodings the csv files are written with: CRoster and CXref write utf-8, CPunchcards (punchcards*.csv) the locale's
+# default encoding (None)
+CSV_ENCODINGS = {"roster.csv": "utf-8", "meetup_roster.csv": "utf-8"}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS punchcards (
+    id INTEGER PRIMARY KEY,
+    hockeyID TEXT, meetupName TEXT, altID TEXT, altName TEXT, status TEXT, purchaseDate TEXT,
+    extra TEXT NOT NULL DEFAULT '[]',
+    history TEXT NOT NULL DEFAULT '');
+CREATE INDEX IF NOT EXISTS punchcards_hockeyID ON punchcards(hockeyID, status);
+CREATE INDEX IF NOT EXISTS punchcards_altID ON punchcards(altID, status);
+CREATE INDEX IF NOT EXISTS punchcards_status ON punchcards(status);
+CREATE INDEX IF NOT EXISTS punchcards_history ON punchcards(history);
+CREATE TABLE IF NOT EXISTS punches (
+    card INTEGER NOT NULL, slot INTEGER NOT NULL, date TEXT NOT NULL,
+    PRIMARY KEY (card, slot)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS punches_date ON punches(date);
+CREATE TABLE IF NOT EXISTS nullslots (
+    card INTEGER NOT NULL, slot INTEGER NOT NULL,
+    PRIMARY KEY (card, slot)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS roster (
+    {" TEXT, ".join(CRosterRecord.COLUMNS)} TEXT,
+    extra TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (hockeyID));
+CREATE TABLE IF NOT EXISTS xref (
+    meetupID TEXT PRIMARY KEY, meetupName TEXT, hockeyID TEXT);
+CREATE INDEX IF NOT EXISTS xref_hockeyID ON xref(hockeyID);
+"""
+
+#-------------------------------------------------------------------------------
+class CDatabaseLog:
+    """Stands in for CJournal when the data lives in hockey.db: the change records CPunchcards and CRoster would append
+    to their journal are queued here and applied as one transaction by flush(). There is never anything to replay or
+    compact, since the database itself is always current."""
+    def __init__(self, apply):
+        self.apply = apply
+        self.pending = []
+        self.count = 0
+
+    def replay(self):
+        return []
+
+    def append(self, record):
+        self.pending.append(record)
+
+    def flush(self):
+        if len(self.pending) > 0:
+            self.apply(self.pending)
+        self.pending = []
+
+    def discard(self):
+        self.pending = []
+
+    def reset(self):
+        self.pending = []
+
+#-------------------------------------------------------------------------------
+class CDatabase:
+    """SQLite storage (hockey.db) for the punchcards, punchcard history, roster and Meetup cross reference.
+
+    Selected by setting "storage_backend" to "sqlite" in info.json. CPunchcards and CRoster still work on their rows in
+    memory; they load them from here and their changes are written back as indexed UPDATE/INSERT statements instead of
+    rewriting the whole file. importCSV() and exportCSV() copy everything to and from the usual tab separated files,
+    so they can still be opened in a spreadsheet:
+
+        python CDatabase.py import
+        python CDatabase.py export
+    """
+    def __init__(self):
+        self.path = getHockeyPath()
+        self.databaseFilename = os.path.join(self.path, "hockey.db")
+        import sqlite3      # only with the sqlite storage backend, so csv users don't load it at startup
+        self.connection = sqlite3.connect(self.databaseFilename)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")       # a charge is durable before its email goes out
+        self.connection.executescript(SCHEMA)
+        with self.connection:       # hockey.db files made before nullslots existed kept the 'NULL' markers as punches
+            self.connection.execute("INSERT OR IGNORE INTO nullslots (card, slot) SELECT card, slot FROM punches WHERE date = 'NULL'")
+            self.connection.execute("DELETE FROM punches WHERE date = 'NULL'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.close()
+
+    #-------------------------------------------------------------------------------
+    def _readCards(self, where, params=()):
+        """Return [(id, CPunchcardRecord), ...] for the punchcards matching the WHERE clause, in id order"""
+        cards = {}
+        for cardID, hockeyID, meetupName, altID, altName, status, purchaseDate, extra in self.connection.execute(
+                f"SELECT id, hockeyID, meetupName, altID, altName, status, purchaseDate, extra FROM punchcards WHERE {where} ORDER BY id", params):
+            cards[cardID] = CPunchcardRecord.fromRow([hockeyID, meetupName, altID, altName, status, purchaseDate] +
+                                                     [''] * CPunchcardRecord.SLOT_COUNT + json.loads(extra))
+        for cardID, slot, date in self.connection.execute(
+                f"SELECT card, slot, date FROM punches WHERE card IN (SELECT id FROM punchcards WHERE {where})", params):
+            cards[cardID].dates[slot] = encodeDate(date)
+        for cardID, slot in self.connection.execute(
+                f"SELECT card, slot FROM nullslots WHERE card IN (SELECT id FROM punchcards WHERE {where})", params):
+            cards[cardID].dates[slot] = DATE_NULL
+        return list(cards.items())
+
+    #-------------------------------------------------------------------------------
+    def loadPunchcards(self):
+        """Return [(database id, CPunchcardRecord), ...] for the current (not archived) punchcards"""
+        countFileLoad("hockey.db:punchcards")
+        return self._readCards("history = ''")
+
+    #-------------------------------------------------------------------------------
+    def loadHistory(self, startdate='', enddate='', player=''):
+        """Archived punchcards with any play date between startdate and enddate (YYYYMMDD), found with the play date
+        index, and belonging to (or listing as alt payer) the given player. Leave any of them empty to not filter on it."""
+        countFileLoad("hockey.db:history")
+        where = "history != ''"
+        params = ()
+        if len(startdate) > 0 or len(enddate) > 0:
+            where += " AND id IN (SELECT card FROM punches WHERE date BETWEEN ? AND ?)"
+            params += (startdate or "00000000", enddate or "99999999")
+        if len(player) > 0:
+            where += " AND (hockeyID = ? OR altID = ?)"
+            params += (player, player)
+        return [row for _, row in self._readCards(where, params)]
+
+    #-------------------------------------------------------------------------------
+    def _insertCard(self, row, history=''):
+        cursor = self.connection.execute(
+            "INSERT INTO punchcards (hockeyID, meetupName, altID, altName, status, purchaseDate, extra, history) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            row[:len(PUNCHCARD_FIELDS)] + [json.dumps(list(row.extra)), history])
+        self.connection.executemany("INSERT INTO punches (card, slot, date) VALUES (?, ?, ?)",
+                                    [(cursor.lastrowid, slot, row[CPunchcardRecord.FIRST_DATE_COLUMN + slot])
+                                     for slot, code in enumerate(row.dates) if code > 0])
+        # the 'NULL' marker (unused 11th slot) is not a play date, so it is kept out of punches and its date index
+        self.connection.executemany("INSERT INTO nullslots (card, slot) VALUES (?, ?)",
+                                    [(cursor.lastrowid, slot) for slot, code in enumerate(row.dates) if code == DATE_NULL])
+        return cursor.lastrowid
+
+    #-------------------------------------------------------------------------------
+    def applyPunchcardChanges(self, records, cardIDs):
+        """Apply CPunchcards change records (the same ones journal mode writes to punchcards.journal) in one transaction.
+        cardIDs is the database id of each punchcard row; the ids of new cards are appended to it."""
+        with self.connection:
+            for record in records:
+                op = record["op"]
+                if op == "card":
+                    cardIDs.append(self._insertCard(CPunchcardRecord.fromRow(record["fields"])))
+                elif op == "punch":
+                    self._setPunch(cardIDs[record["row"]], record["slot"], record["date"])
+                elif op == "status":
+                    self.connection.execute("UPDATE punchcards SET status = ? WHERE id = ?", (record["status"], cardIDs[record["row"]]))
+                elif op == "set" and record["col"] < len(PUNCHCARD_FIELDS):
+                    self.connection.execute(f"UPDATE punchcards SET {PUNCHCARD_FIELDS[record['col']]} = ? WHERE id = ?",
+                                            (record["value"], cardIDs[record["row"]]))
+                elif op == "set" and record["col"] < CPunchcardRecord.COLUMN_COUNT:
+                    self._setPunch(cardIDs[record["row"]], record["col"] - CPunchcardRecord.FIRST_DATE_COLUMN, record["value"])
+                else:
+                    print("ERROR 731: Unknown punchcard change record", record)
+
+    #-------------------------------------------------------------------------------
+    def _setPunch(self, cardID, slot, date):
+        self.connection.execute("DELETE FROM nullslots WHERE card = ? AND slot = ?", (cardID, slot))
+        if len(date) == 0 or encodeDate(date) == DATE_NULL:
+            self.connection.execute("DELETE FROM punches WHERE card = ? AND slot = ?", (cardID, slot))
+            if len(date) > 0:
+                self.connection.execute("INSERT INTO nullslots (card, slot) VALUES (?, ?)", (cardID, slot))
+        else:
+            self.connection.execute("INSERT OR REPLACE INTO punches (card, slot, date) VALUES (?, ?, ?)", (cardID, slot, date))
+
+    #-------------------------------------------------------------------------------
+    def archivePunchcards(self, cardIDs, partitions):
+        """Move punchcards into the history. partitions maps database id -> history partition (file) name."""
+        with self.connection:
+            self.connection.executemany("UPDATE punchcards SET history = ? WHERE id = ?",
+                                        [(partitions[cardID], cardID) for cardID in cardIDs])
+
+    #-------------------------------------------------------------------------------
+    def loadRoster(self):
+        countFileLoad("hockey.db:roster")
+        roster = {}
+        for row in self.connection.execute(f"SELECT {ROSTER_COLUMNS}, extra FROM roster ORDER BY upper(meetupName)"):
+            roster[row[0]] = CRosterRecord.fromRow(list(row[:-1]) + json.loads(row[-1]))
+        return roster
+
+    #-------------------------------------------------------------------------------
+    def _insertPlayer(self, row):
+        self.connection.execute(f"INSERT OR REPLACE INTO roster ({ROSTER_COLUMNS}, extra) VALUES ({', '.join('?' * (len(CRosterRecord.COLUMNS) + 1))})",
+                                row[:len(CRosterRecord.COLUMNS)] + [json.dumps(list(row.extra))])
+
+    #-------------------------------------------------------------------------------
+    def applyRosterChanges(self, records):
+        """Apply CRoster change records (the same ones journal mode writes to roster.journal) in one transaction"""
+        with self.connection:
+            for record in records:
+                if record["op"] == "stars":
+                    self.connection.execute("UPDATE roster SET stars = ?, cumStars = ? WHERE hockeyID = ?",
+                                            (str(record["stars"]), str(record["cumStars"]), record["id"]))
+                elif record["op"] == "player":
+                    self._insertPlayer(CRosterRecord.fromRow(record["fields"]))
+                else:
+                    print("ERROR 732: Unknown roster change record", record)
+
+    #-------------------------------------------------------------------------------
+    def loadXref(self):
+        """Return the meetup_roster.csv rows: [Meetup name, Meetup User ID, Hockey User ID]"""
+        countFileLoad("hockey.db:xref")
+        return [list(row) for row in self.connection.execute("SELECT meetupName, meetupID, hockeyID FROM xref ORDER BY upper(meetupName)")]
+
+    #-------------------------------------------------------------------------------
+    def addXref(self, hockeyID, meetupName, meetupID):
+        with self.connection:
+            self.connection.execute("INSERT INTO xref (meetupID, meetupName, hockeyID) VALUES (?, ?, ?)", (meetupID, meetupName, hockeyID))
+
+    #-------------------------------------------------------------------------------
+    def _readCSV(self, filename):
+        with open(os.path.join(self.path, filename), newline='', encoding=CSV_ENCODINGS.get(filename)) as csvfile:
+            rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
+            next(rows)
+            return [row for row in rows if len(row) > 0]
+
+    #-------------------------------------------------------------------------------
+    def importCSV(self):
+        """Replace the contents of hockey.db with punchcards.csv, the history files, roster.csv and meetup_roster.csv"""
+        import CPunchcards
+        historyFiles = CPunchcards.historyPartitions(self.path)
+        if os.path.exists(os.path.join(self.path, "punchcards_history.csv")):
+            historyFiles.insert(0, "punchcards_history.csv")
+        with self.connection:
+            for table in ("punches", "nullslots", "punchcards", "roster", "xref"):
+                self.connection.execute(f"DELETE FROM {table}")
+            for filename in [""] + historyFiles:
+                rows = self._readCSV(filename or "punchcards.csv")
+                for row in rows:
+                    self._insertCard(CPunchcardRecord.fromRow(row), filename)
+                print(f"INFO 733: Imported {len(rows)} punchcards from {filename or 'punchcards.csv'}")
+            rows = self._readCSV("roster.csv")
+            for row in rows:
+                self._insertPlayer(CRosterRecord.fromRow(row))
+            print(f"INFO 733: Imported {len(rows)} players from roster.csv")
+            rows = self._readCSV("meetup_roster.csv")
+            self.connection.executemany("INSERT OR REPLACE INTO xref (meetupName, meetupID, hockeyID) VALUES (?, ?, ?)", [row[:3] for row in rows])
+            print(f"INFO 733: Imported {len(rows)} Meetup IDs from meetup_roster.csv")
+
+    #-------------------------------------------------------------------------------
+    def _writeCSV(self, filename, header, rows, quoting):
+        filepath = os.path.join(self.path, filename)
+        with open(filepath + ".tmp", 'w', newline='', encoding=CSV_ENCODINGS.get(filename)) as csvfile:
+            writer = csv.writer(csvfile, delimiter='\t', quotechar='"', quoting=quoting)
+            writer.writerow(header)
+            writer.writerows(rows)
+        replaceFileAtomic(filepath + ".tmp", filepath)
+        print(f"INFO 734: Exported {len(rows)} rows to {filename}")
+
+    #-------------------------------------------------------------------------------
+    def exportCSV(self):
+        """Write hockey.db back out as punchcards.csv, the history files, roster.csv and meetup_roster.csv"""
+        history = dict(self.connection.execute("SELECT id, history FROM punchcards"))
+        byFile = {}
+        for cardID, row in self._readCards("1"):
+            byFile.setdefault(history[cardID], []).append(row)
+        self._writeCSV("punchcards.csv", CPunchcardRecord.FILE_HEADER, byFile.pop('', []), csv.QUOTE_MINIMAL)
+
+        manifest = {"partitions": {}}
+        for filename, rows in sorted(byFile.items()):
+            self._writeCSV(filename, CPunchcardRecord.FILE_HEADER, rows, csv.QUOTE_MINIMAL)
+            if filename != "punchcards_history.csv":
+                year = filename[len("punchcards_history_"):-len(".csv")]
+                dates = [str(code) for row in rows for code in row.dates if code > 0] or [year + "0101"]
+                manifest["partitions"][year] = {"file": filename, "cards": len(rows), "firstDate": min(dates), "lastDate": max(dates)}
+        if len(manifest["partitions"]) > 0:
+            with open(os.path.join(self.path, "punchcards_history.json"), 'w') as file:
+                json.dump(manifest, file, indent=4)
+
+        self._writeCSV("roster.csv", CRosterRecord.FILE_HEADER, list(self.loadRoster().values()), csv.QUOTE_NONNUMERIC)
+        xref = self.connection.execute("SELECT meetupName, meetupID, hockeyID FROM xref ORDER BY upper(meetupName)").fetchall()
+        self._writeCSV("meetup_roster.csv", XREF_FILE_HEADER, xref, csv.QUOTE_ALL)
+
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "export"):
+        print("usage: python CDatabase.py import|export")
+        sys.exit(1)
+    with CDatabase() as database:
+        if sys.argv[1] == "import":
+            database.importCSV()
+        else:
+            database.exportCSV()
+    print("all done")
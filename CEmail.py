@@ -3,21 +3,22 @@ import sys
 #import sendgrid
 #from sendgrid import SendGridAPIClient
 #from sendgrid.helpers.mail import Mail
-import smtplib
-from email.message import EmailMessage
-import CPunchcards
+import CSession
 from CInfo import CInfo
 from utils import *
 sys.path.append("\\")
 
 #-------------------------------------------------------------------------------
 class CEmail:
-    def __init__(self):
+    def __init__(self, session=None):
         self.path = getHockeyPath()
-        self.info = CInfo()
+        self.session = session if session is not None else CSession.CSession()
+        self.session.attach(self)
+        self.info = self.session.info
         self.useStars = self.info.getValue("use_stars")
         #self.SENDGRID_API_KEY = self.info.getValue("sendgrid_api_key")
         self.GOOGLE_APP_PASSWORD = self.info.getValue("google_app_password")
+        self.outbox = None          # emails held while a CUnitOfWork is open (None = send straight away)
         
     def __enter__(self):
         return self
@@ -49,7 +50,7 @@ class CEmail:
     #-------------------------------------------------------------------------------    
     def composeUsePunchcardEmail(self, playerID, meetupName, date, pcRow, pcIdx, bEarlyBird, starcount, gameStars):
         
-        punchcards = CPunchcards.CPunchcards()
+        punchcards = self.session.punchcards
         # Calculate remaining punches using utility function
         punches_used, remainingPunches, total_slots = punchcards.countPunchcardSlots(pcRow)
         boughtNextCard = False
@@ -124,7 +125,7 @@ class CEmail:
     #-------------------------------------------------------------------------------    
     def composePunchcardPurchaseEmail(self, meetupName, date, remainingPunchcards, bPastDuePunches):
         
-        punchcards = CPunchcards.CPunchcards()
+        punchcards = self.session.punchcards
         
         subject = "Your new Underwater Hockey punchcard has been activated!"
         body = "Hi " + meetupName + ",\n\n"
@@ -168,7 +169,7 @@ class CEmail:
  
     #-------------------------------------------------------------------------------    
     def sendInvitationalEmail(self):
-        info = CInfo()
+        info = self.info
         
         print()
         emailAddress = input("Email address ")
@@ -183,15 +184,44 @@ class CEmail:
         for ccEmail in ccList:                
             self.sendEmail(ccEmail, "An invite has been sent to " + name + " at " + emailAddress, body)
 
+    #-------------------------------------------------------------------------------    
+    def holdEmails(self):
+        """Queue emails instead of sending them, until releaseEmails() or discardEmails()"""
+        self.outbox = []
+
+    #-------------------------------------------------------------------------------    
+    def releaseEmails(self):
+        """Send the queued emails (once the changes they describe have been saved)"""
+        outbox, self.outbox = self.outbox or [], None
+        for toAddress, subject, message in outbox:
+            self._deliverEmail(toAddress, subject, message)
+
+    #-------------------------------------------------------------------------------    
+    def discardEmails(self):
+        """Drop the queued emails (the changes they describe were rolled back). Returns how many there were."""
+        outbox, self.outbox = self.outbox or [], None
+        return len(outbox)
+
     #-------------------------------------------------------------------------------    
     def sendEmail(self, toAddress, subject, message):
+        if self.outbox is not None:
+            self.outbox.append((toAddress, subject, message))
+            print("-----------------------------------: Email queued (sent when the changes are saved) TO", toAddress)
+            print("SUBJECT", subject)
+            return True
+        return self._deliverEmail(toAddress, subject, message)
+
+    #-------------------------------------------------------------------------------    
+    def _deliverEmail(self, toAddress, subject, message):
   	# Display the email
         print("-----------------------------------: Email successfully sent TO", toAddress)
         print("SUBJECT", subject)
         print("TEXT", message)
         print("-----------------------------------------------------------------")
 
-        # Send the email
+        # Send the email (smtplib and the email package are only imported when an email actually goes out)
+        import smtplib
+        from email.message import EmailMessage
         msg = EmailMessage()
         msg['Subject'] = subject
         msg['From'] = self.info.getValue("club_email")
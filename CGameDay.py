@@ -1,37 +1,34 @@
 import os
 import sys
 import csv
-import CPunchcards
-import CEmail
-import CRoster
+import CSession
+from CUnitOfWork import CUnitOfWork
+from CGameFile import CGameFile, earlyBirdCutoff
 from CInfo import CInfo
 from readAttendees import *
 from utils import *
-import pandas as pd
 import datetime
 sys.path.append("\\")
 
-THURSDAY = 3
+STARS_FOR_FREE_GAME = 20
 
 #-------------------------------------------------------------------------------
 class CGameDay:
-    def __init__(self, date = ""):
+    def __init__(self, date = "", session = None, download = True):
         self.path = getHockeyPath()
         self.M_MEETUPNAME = 0
         self.M_MEETUPUSERID = 2
         self.M_SIGNUPTIME = 6
-        self.X_MEETUPNAME = 0           
-        self.X_MEETUPUSERID = 1
-        self.X_HOCKEYUSERID = 2   
-        self.meetupRosterHeader = ["Meetup name", "Meetup User ID", "Hockey User ID"]
         self.fileDelimiter = ","       # Meetup file delimiter (old format='\t', new format=',')
-        self.gameday = {}
-        self.gameday_df = None
-        self.info = CInfo()
+        self.gameday = {}               # Meetup User ID -> CAttendeeRecord
+        self.session = session if session is not None else CSession.CSession()
+        self.info = self.session.info
         self.useStars = self.info.getValue("use_stars")
         self.date = date
+        self.download = download        # look in the Downloads folder for a missing YYYYMMDD.csv
         #self.date = "20250105"
         if len(date) > 0:            
+            self.cutoff = earlyBirdCutoff(date)     # the same for every attendee, so worked out once
             self._loadGameDay()
         
     def __enter__(self):
@@ -50,59 +47,33 @@ class CGameDay:
         # loadup attendees from meetup
         self.gameday = {}
 
-        # new MeetUp file format
+        # new MeetUp file format (YYYYMMDD.csv), else the old one (YYYYMMDD.xls)
         filepath = os.path.join(self.path, "games", f"{self.date}.csv")
-        if not os.path.exists(filepath):
+        if not os.path.exists(filepath) and self.download:
             checkForDownload(self.date)
-        if os.path.exists(filepath):
-            try:
-                self.fileDelimiter = ','
-                df = pd.read_csv(filepath, delimiter=self.fileDelimiter)
-                df['RSVPed on'] = pd.to_datetime(df['RSVPed on'])
-                self.gameday_df = df
-            except Exception as e:
-                print(f"Error reading attendees file: {e}")
-                self.gameday_df = None
-
-        # old MeetUp file format
-        else:
+        if not os.path.exists(filepath):
             filepath = os.path.join(self.path, "games", f"{self.date}.xls")
             if not os.path.exists(filepath):
                 print(f"\nERROR 594: No game file exists for {self.date}")
                 return          
-            try:
-                self.fileDelimiter = '\t'
-                df = pd.read_csv(filepath, delimiter=self.fileDelimiter)
-                df['RSVPed on'] = pd.to_datetime(df['RSVPed on'])
-                self.gameday_df = df
-            except Exception as e:
-                print(f"Error reading attendees file: {e}")
-                self.gameday_df = None
+        gameFile = CGameFile(filepath)
+        self.fileDelimiter = gameFile.delimiter
 
         print(f"The following players played UWH on {self.date}")
         print(f"--------------------------------------------")        
-        with open(filepath, newline='') as csvfile:
-            rows = csv.reader(csvfile, delimiter=self.fileDelimiter, quotechar='"')
-            for row_number,row in enumerate(rows):
-                print(', '.join(row))
-                if row_number > 0 and len(row) > 0:
-                    row[self.M_SIGNUPTIME] = df.iloc[row_number-1]['RSVPed on']
-                    self.gameday[row[self.M_MEETUPUSERID]] = row     
+        try:
+            attendees = gameFile.attendees(echo=True)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            print(f"Error reading attendees file: {e}")
+            return
+        for attendee in attendees:
+            self.gameday[attendee.meetupID] = attendee
         return
 
     #-------------------------------------------------------------------------------    
     def _createXref(self):  
-        self.idXref = {}
-        filepath = os.path.join(self.path, "meetup_roster.csv")
-        try:
-            with open(filepath, newline='') as csvfile:
-                rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
-                next(rows)
-                for row in rows:
-                    if len(row) > 0:    
-                        self.idXref[row[self.X_MEETUPUSERID]] = row[self.X_HOCKEYUSERID]     
-        except Exception as e:
-            print(f"Error reading xref file: {e}")
+        # shared with the rest of the session, so meetup_roster.csv is only read once
+        self.idXref = self.session.xref
        
     #-------------------------------------------------------------------------------    
     def isValid(self):    
@@ -110,44 +81,19 @@ class CGameDay:
         
     #-------------------------------------------------------------------------------    
     def addNewXref(self, hockeyID, meetupName, meetupID):
-        if meetupID in self.idXref or 'user ' + meetupID in self.idXref:
+        if meetupID in self.idXref:
 
             print("ERROR 977: Trying to add player who is already in the roster XREF. Contact ", 
                   self.info.getValue("admin_contact_info"), hockeyID, meetupName, meetupID)
             sys.exit(92)
             
-        # load the meetup_roster.csv file
-        filepath = os.path.join(self.path, "meetup_roster.csv")
-        rowlist = []
-        with open(filepath, newline='') as csvfile:
-            rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
-            next(rows)
-            for row in rows:
-                rowlist.append(row)                         
-                
-        # add new row
-        newrow = ['','','']
-        newrow[self.X_HOCKEYUSERID] = hockeyID
-        newrow[self.X_MEETUPNAME] = meetupName
-        newrow[self.X_MEETUPUSERID] = meetupID    
-        rowlist.append(newrow)     
-
-        # sort into meetupName order
-        rowlist = sorted(rowlist, key=lambda x: x[self.X_MEETUPNAME].upper())
-        
-        # save the meetup_roster.csv file
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile, delimiter='\t', quotechar='"', quoting=csv.QUOTE_ALL)
-            writer.writerow(self.meetupRosterHeader)
-            writer.writerows(rowlist)
-            
-        # load the new cross reference
-        self._createXref()
+        # appended to meetup_roster.csv (or inserted into hockey.db); the session's cross reference is updated in place
+        self.idXref.add(hockeyID, meetupName, meetupID)
     
     #-------------------------------------------------------------------------------    
     def addPlayerToRoster(self):
 
-        roster = CRoster.CRoster()
+        roster = self.session.roster
         new_player_list = [meetup_id for meetup_id in self.gameday if not roster.getMeetupName(self.getHockeyID(meetup_id))]
 
         if not new_player_list:
@@ -181,12 +127,11 @@ class CGameDay:
     def isEarlyBird(self, meetupID, gameDate):
         # all variables as datetime
         dt_signupTime = self.gameday[meetupID][self.M_SIGNUPTIME]
-        dt_gameDate = datetime.datetime.strptime(gameDate, "%Y%m%d")
+        if dt_signupTime is None:
+            return False
 
         # cutoff time for both games (Friday and Sunday) are at Thursday midnight
-        dt_cutoff = dt_gameDate.date()
-        while dt_cutoff.weekday() != THURSDAY:
-            dt_cutoff -= datetime.timedelta(days=1)
+        dt_cutoff = self.cutoff if gameDate == self.date else earlyBirdCutoff(gameDate)
 
         retval = (dt_signupTime.date() <= dt_cutoff)
         return retval
@@ -194,7 +139,7 @@ class CGameDay:
     #-------------------------------------------------------------------------------    .
     def printGameDay(self):
         
-        punchcards = CPunchcards.CPunchcards()
+        punchcards = self.session.punchcards
         
         print()
         print(f"Underwater Hockey Gameday for {self.date}")
@@ -235,17 +180,8 @@ class CGameDay:
 
     #-------------------------------------------------------------------------------    
     def getHockeyID(self, meetupID):
-        try:
-            if meetupID in self.idXref:
-                retval = self.idXref[meetupID]
-            elif 'user ' + meetupID in self.idXref:
-                retval = self.idXref['user ' + meetupID]
-            else:
-                retval = meetupID
-        except:
-            retval = meetupID
-            print("ERROR 483: meetupID not found in cross reference ", meetupID)
-        return retval
+        # players not in meetup_roster.csv yet keep their Meetup User ID
+        return self.idXref.getHockeyID(meetupID)
 
 
     def handleAlreadyProcessedError(self):
@@ -261,9 +197,9 @@ class CGameDay:
     #-------------------------------------------------------------------------------    
     def analyze(self):
         
-        punchcards = CPunchcards.CPunchcards()
-        email = CEmail.CEmail()
-        roster = CRoster.CRoster()      
+        punchcards = self.session.punchcards
+        email = self.session.email
+        roster = self.session.roster
 
         if punchcards.alreadyProcessed(self.date):
             self.handleAlreadyProcessedError()
@@ -271,47 +207,83 @@ class CGameDay:
         print(f"UWH Gameday analysis for {self.date}")
         print(f"----------------------------------------")
         
-        for meetupID, playerInfo in self.gameday.items():
-            self.processPlayer(meetupID, playerInfo, roster, punchcards, email)
+        plan = self.planGameDay(roster)
+        for idx in range(len(plan["meetupID"])):
+            self.processPlayer(plan, idx, roster, punchcards, email)
+            # the email has gone out, so in journal mode make this player's charge durable right away
+            punchcards.checkpoint()
+            roster.checkpoint()
             
         print()
         
         punchcards._savePunchcards() 
         roster.saveRoster()      
+        
+        # anyone charged twice today (only today's history partition is read)
+        punchcards.errorCheck(self.date, self.date)
         return
 
     #-------------------------------------------------------------------------------           
-    def processPlayer(self, meetupID, playerInfo, roster, punchcards, email):
-
-        starcount = 0
-        bEarlyBird = False
-        gamePaid = False
-
-        hockeyID = self.getHockeyID(meetupID)
-
-        # check if can pay for game using stars
-        if self.useStars:
-            starcount = roster.getStars(hockeyID)
-            if starcount is None:
-                starcount = 0
-                print()
-                print("ERROR reading starcount for ", playerInfo)
-            if starcount >= 20:
-                emailAddress = roster.getEmail(hockeyID) 
-                meetupName = roster.getMeetupName(hockeyID)
-                subject, body = email.composeUseStarsForFreeGameEmail(hockeyID, meetupName, self.date)
-                email.sendEmail(emailAddress, subject, body)
-                starcount -= 20
-                roster.setStars(hockeyID, starcount)
-                gamePaid = True
-            else:
-                bEarlyBird = self.isEarlyBird(meetupID, self.date)
-                if bEarlyBird and hockeyID in roster.roster:
-                    starcount = roster.incrStars(hockeyID)
+    def planGameDay(self, roster):
+        """Decide how every attendee pays before anything is changed. Returns the plan as columns, one entry per
+        attendee in file order:
+            meetupID, hockeyID
+            starcount   stars before this game (None if unreadable)
+            payment     "stars" (a free game for STARS_FOR_FREE_GAME stars) or "punchcard"
+            earlyBird   signed up by the Thursday cutoff (only counted when stars are in use and not spent)
+            earnStar    gets an early bird star
+        Whether a punchcard player has a free punch or goes on the past due account is left to processPlayer(): players
+        sharing a card use up its punches in turn."""
+        plan = {"meetupID": [], "hockeyID": [], "starcount": [], "payment": [], "earlyBird": [], "earnStar": []}
+        stars = {}      # stars after this game so far, for a player who is on the list twice
+        for meetupID in self.gameday:
+            hockeyID = self.getHockeyID(meetupID)
+            starcount = 0
+            payment = "punchcard"
+            bEarlyBird = False
+            if self.useStars:
+                starcount = stars[hockeyID] if hockeyID in stars else roster.getStars(hockeyID)
+                if (starcount or 0) >= STARS_FOR_FREE_GAME:
+                    payment = "stars"
+                    stars[hockeyID] = starcount - STARS_FOR_FREE_GAME
+                else:
+                    bEarlyBird = self.isEarlyBird(meetupID, self.date)
+                    if bEarlyBird and hockeyID in roster.roster and starcount is not None:
+                        stars[hockeyID] = starcount + 1
+            plan["meetupID"].append(meetupID)
+            plan["hockeyID"].append(hockeyID)
+            plan["starcount"].append(starcount)
+            plan["payment"].append(payment)
+            plan["earlyBird"].append(bEarlyBird)
+            plan["earnStar"].append(bEarlyBird and hockeyID in roster.roster)
+        return plan
+
+    #-------------------------------------------------------------------------------           
+    def processPlayer(self, plan, idx, roster, punchcards, email):
+
+        hockeyID = plan["hockeyID"][idx]
+        playerInfo = self.gameday[plan["meetupID"][idx]]
+        bEarlyBird = plan["earlyBird"][idx]
+        starcount = plan["starcount"][idx]
+        if starcount is None:
+            starcount = 0
+            print()
+            print("ERROR reading starcount for ", playerInfo)
+
+        # pay for the game using stars
+        if plan["payment"][idx] == "stars":
+            emailAddress = roster.getEmail(hockeyID) 
+            meetupName = roster.getMeetupName(hockeyID)
+            subject, body = email.composeUseStarsForFreeGameEmail(hockeyID, meetupName, self.date)
+            email.sendEmail(emailAddress, subject, body)
+            roster.spendStars(hockeyID, STARS_FOR_FREE_GAME, self.date, "free game")
+            return
+
+        if plan["earnStar"][idx]:
+            starcount = roster.incrStars(hockeyID, self.date)
 
         # use a punch on their punchcard (they didn't have enough stars yet)
-        if not gamePaid:
-            self.handlePunchcardPayment(hockeyID, playerInfo, punchcards, roster, email, bEarlyBird, starcount)
+        self.handlePunchcardPayment(hockeyID, playerInfo, punchcards, roster, email, bEarlyBird, starcount)
 
     #-------------------------------------------------------------------------------               
     def handlePunchcardPayment(self, hockeyID, playerInfo, punchcards, roster, email, bEarlyBird, starcount):
@@ -335,6 +307,37 @@ class CGameDay:
                 paid = punchcards.makePaymentBySlot(pcIdx, slot, self.date)
                 print(hockeyID, playerInfo[self.M_MEETUPNAME], ">>>", "added to past due account")        
 
+#-------------------------------------------------------------------------------           
+def analyzeDateRange(startdate, enddate, session = None):
+    """Charge punchcards for every game in games/ from startdate to enddate (YYYYMMDD, inclusive), oldest first.
+
+    All the games are processed against the one copy of the punchcards and roster in the session, inside a single
+    CUnitOfWork, so the files are written once at the end (or not at all if something goes wrong). The punch-used
+    emails are held until then too, so a failed run sends nothing and re-running it charges and emails each player once.
+    Dates that have already been charged are skipped. Returns the dates that were processed."""
+    session = session if session is not None else CSession.CSession()
+    punchcards = session.punchcards
+    roster = session.roster
+
+    dates = []
+    for date in session.attendance.getGameDates(startdate, enddate):
+        if punchcards.alreadyProcessed(date):
+            print(f"INFO 595: {date} has already been processed, skipping it")
+        else:
+            dates.append(date)
+    if len(dates) == 0:
+        print(f"INFO 596: No unprocessed games between {startdate} and {enddate}")
+        return dates
+
+    with CUnitOfWork(punchcards, roster, session.email):
+        for date in dates:
+            print()
+            g = CGameDay(date, session, download=False)
+            if g.isValid():
+                g.analyze()
+    print(f"INFO 597: Processed {len(dates)} games: {', '.join(dates)}")
+    return dates
+
 #-------------------------------------------------------------------------------           
 if __name__ == "__main__":        
             
@@ -0,0 +1,118 @@
+import os
+import re
+import csv
+import datetime
+from CRecords import CAttendeeRecord
+from utils import *
+
+M_MEETUPNAME = 0
+M_MEETUPUSERID = 2
+M_SIGNUPTIME = 6
+SIGNUP_TIME_HEADER = "RSVPed on"
+THURSDAY = 3
+
+# game files: YYYYMMDD.csv (current Meetup download, comma separated) or YYYYMMDD.xls (older download, tab separated)
+GAME_FILE_PATTERN = re.compile(r"^(20\d{6})\.(csv|xls)$", re.IGNORECASE)
+
+# formats Meetup has used for "RSVPed on", tried after ISO 8601 (datetime.fromisoformat)
+SIGNUP_TIME_FORMATS = ["%m/%d/%Y %I:%M %p", "%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S", "%m/%d/%y %I:%M %p", "%m/%d/%y %H:%M",
+                       "%Y-%m-%d %I:%M %p", "%b %d, %Y %I:%M %p", "%m/%d/%Y"]
+
+#-------------------------------------------------------------------------------
+def findGameFiles(gamesPath):
+    """Return {date: (filename, [size, mtime])} for the game files in gamesPath, preferring YYYYMMDD.csv like CGameDay
+    does"""
+    gameFiles = {}
+    if not os.path.isdir(gamesPath):
+        return gameFiles
+    with os.scandir(gamesPath) as entries:
+        for entry in entries:
+            match = GAME_FILE_PATTERN.match(entry.name)
+            if match is None or not entry.is_file():
+                continue
+            date, isCSV = match.group(1), match.group(2).lower() == "csv"
+            if date in gameFiles and not isCSV:
+                continue
+            stat = entry.stat()
+            gameFiles[date] = (entry.name, [stat.st_size, stat.st_mtime_ns])
+    return gameFiles
+
+#-------------------------------------------------------------------------------
+def earlyBirdCutoff(gameDate):
+    """Last day (a datetime.date) to sign up for the game on gameDate (YYYYMMDD) and earn an early bird star. The
+    cutoff for both games (Friday and Sunday) is Thursday midnight."""
+    cutoff = datetime.datetime.strptime(gameDate, "%Y%m%d").date()
+    while cutoff.weekday() != THURSDAY:
+        cutoff -= datetime.timedelta(days=1)
+    return cutoff
+
+#-------------------------------------------------------------------------------
+class CTimestampParser:
+    """Parses the signup times of one game file. Every row of a file has the same format, so the format that worked
+    last is tried first and the rest of the rows each take one strptime (or fromisoformat) call."""
+    def __init__(self):
+        self.lastFormat = None
+
+    #-------------------------------------------------------------------------------
+    def _tryFormat(self, fmt, text):
+        try:
+            return datetime.datetime.fromisoformat(text) if fmt is None else datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            return None
+
+    #-------------------------------------------------------------------------------
+    def parse(self, text):
+        """Return the datetime for text, or None if it isn't in any known format"""
+        text = text.strip()
+        if len(text) == 0:
+            return None
+        if self.lastFormat is not None or text[:4].isdigit():
+            value = self._tryFormat(self.lastFormat, text)
+            if value is not None:
+                return value
+        for fmt in [None] + SIGNUP_TIME_FORMATS:
+            if fmt != self.lastFormat:
+                value = self._tryFormat(fmt, text)
+                if value is not None:
+                    self.lastFormat = fmt
+                    return value
+        return None
+
+#-------------------------------------------------------------------------------
+class CGameFile:
+    """Reads a Meetup attendee download in one pass: YYYYMMDD.csv (comma separated) or the older YYYYMMDD.xls (which
+    is really tab separated text)."""
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.delimiter = ',' if filepath.lower().endswith(".csv") else '\t'
+        self.header = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def attendees(self, echo=False):
+        """Return the attendee records, in file order. With echo, each row is printed as it's read."""
+        countFileLoad(os.path.basename(self.filepath))
+        records = []
+        timestamps = CTimestampParser()
+        with open(self.filepath, newline='') as csvfile:
+            rows = csv.reader(csvfile, delimiter=self.delimiter, quotechar='"')
+            self.header = next(rows, [])
+            if echo:
+                print(', '.join(self.header))
+            timeColumn = self.header.index(SIGNUP_TIME_HEADER) if SIGNUP_TIME_HEADER in self.header else M_SIGNUPTIME
+            for row in rows:
+                if echo:
+                    print(', '.join(row))
+                if len(row) == 0:
+                    continue
+                signupTime = timestamps.parse(row[timeColumn]) if len(row) > timeColumn else None
+                if signupTime is None:
+                    print(f"WARNING 771: Unreadable signup time for {row[M_MEETUPNAME]} in {os.path.basename(self.filepath)}")
+                records.append(CAttendeeRecord.fromRow(row, signupTime))
+        return records
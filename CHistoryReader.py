@@ -0,0 +1,131 @@
+import os
+import io
+import csv
+import json
+import mmap
+import locale
+from array import array
+from CRecords import CPunchcardRecord
+from utils import *
+
+#-------------------------------------------------------------------------------
+class CHistoryReader:
+    """Reads selected rows of a punchcard history file without parsing the rest of it.
+
+    The first time a file is queried, one pass records where each line starts and the player, alt payer and first/last
+    play date of the card on it. This index is saved next to the file as <file>.index (with the file's size and
+    modification time, so an edited file gets a new index). Queries then look up the matching lines in the index, and
+    only those lines are read (through a memory map) and parsed.
+    """
+    def __init__(self, filename):
+        self.path = getHockeyPath()
+        self.filepath = os.path.join(self.path, filename)
+        self.indexFilename = self.filepath + ".index"
+        self.encoding = locale.getpreferredencoding(False)     # the history files are written with the default encoding
+        self.offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def _sourceSignature(self):
+        stat = os.stat(self.filepath)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    #-------------------------------------------------------------------------------
+    def _loadIndex(self):
+        """The index is a JSON header line (source signature, row count, player -> [start, count] into playerLines)
+        followed by the offsets, firstDates, lastDates and playerLines arrays as raw bytes"""
+        if self.offsets is not None:
+            return
+        if os.path.exists(self.indexFilename):
+            try:
+                with open(self.indexFilename, 'rb') as file:
+                    header = json.loads(file.readline())
+                    if header["source"] == self._sourceSignature():
+                        self.offsets, self.firstDates, self.lastDates, self.playerLines = array('q'), array('i'), array('i'), array('i')
+                        for values, count in ((self.offsets, header["rows"]), (self.firstDates, header["rows"]),
+                                              (self.lastDates, header["rows"]), (self.playerLines, header["playerLines"])):
+                            values.fromfile(file, count)
+                        self.players = header["players"]
+                        return
+            except (ValueError, KeyError, EOFError):
+                pass
+        self._buildIndex()
+
+    #-------------------------------------------------------------------------------
+    def _buildIndex(self):
+        """One pass over the file: line offsets, and by player and first/last play date. Saved to <file>.index."""
+        self.offsets, self.firstDates, self.lastDates = array('q'), array('i'), array('i')
+        linesByPlayer = {}
+        countFileLoad(os.path.basename(self.filepath))
+        with open(self.filepath, 'rb') as file:
+            file.readline()         # header
+            offset = file.tell()
+            for line in file:
+                row = next(csv.reader([line.decode(self.encoding)], delimiter='\t', quotechar='"'), [])
+                if len(row) > 0:
+                    rec = CPunchcardRecord.fromRow(row)
+                    dates = [code for code in rec.dates if code > 0]
+                    lineNumber = len(self.offsets)
+                    self.offsets.append(offset)
+                    self.firstDates.append(min(dates) if len(dates) > 0 else 0)
+                    self.lastDates.append(max(dates) if len(dates) > 0 else 0)
+                    linesByPlayer.setdefault(rec.hockeyID, []).append(lineNumber)
+                    if len(rec.altID) > 0 and rec.altID != rec.hockeyID:
+                        linesByPlayer.setdefault(rec.altID, []).append(lineNumber)
+                offset += len(line)
+
+        self.players = {}
+        self.playerLines = array('i')
+        for player, lines in linesByPlayer.items():
+            self.players[player] = [len(self.playerLines), len(lines)]
+            self.playerLines.extend(lines)
+        header = {"source": self._sourceSignature(), "rows": len(self.offsets), "playerLines": len(self.playerLines),
+                  "players": self.players}
+        try:
+            with open(self.indexFilename + ".tmp", 'wb') as file:
+                file.write(json.dumps(header).encode() + b"\n")
+                for values in (self.offsets, self.firstDates, self.lastDates, self.playerLines):
+                    values.tofile(file)
+            os.replace(self.indexFilename + ".tmp", self.indexFilename)
+        except OSError as e:
+            # only a speed-up, so carry on without it
+            print(f"WARNING 741: Could not save {os.path.basename(self.indexFilename)}: {e}")
+
+    #-------------------------------------------------------------------------------
+    def rows(self, startdate='', enddate='', player=''):
+        """Return the punchcards with any play date between startdate and enddate (YYYYMMDD, inclusive) that belong to
+        (or list as alt payer) the given player. Leave any of them empty to not filter on it."""
+        self._loadIndex()
+        if len(player) > 0:
+            start, count = self.players.get(player, [0, 0])
+            lineNumbers = self.playerLines[start:start + count]
+        else:
+            lineNumbers = range(len(self.offsets))
+        if len(startdate) > 0 or len(enddate) > 0:
+            low = int(startdate) if len(startdate) > 0 else 1
+            high = int(enddate) if len(enddate) > 0 else 99999999
+            lineNumbers = [n for n in lineNumbers if self.lastDates[n] >= low and 0 < self.firstDates[n] <= high]
+        if len(lineNumbers) == 0:
+            return []
+
+        # parse each run of consecutive lines in one go
+        rows = []
+        with open(self.filepath, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            runStart = previous = lineNumbers[0]
+            for n in list(lineNumbers[1:]) + [None]:
+                if n == previous + 1:
+                    previous = n
+                    continue
+                end = self.offsets[previous + 1] if previous + 1 < len(self.offsets) else len(mm)
+                text = mm[self.offsets[runStart]:end].decode(self.encoding)
+                for row in csv.reader(io.StringIO(text, newline=''), delimiter='\t', quotechar='"'):
+                    if len(row) > 0:
+                        rows.append(CPunchcardRecord.fromRow(row))
+                runStart = previous = n
+        return rows
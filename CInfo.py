@@ -19,6 +19,14 @@ class CInfo:
             "sendgrid_api_key": "Enter your SendGrid API key here",
             "google_app_password": "Google App Password",
             "use_stars": True,
+            "use_journal": False,
+            "storage_backend": "csv",
+            "journal_compact_after": 500,
+            "show_file_loads": False,
+            "show_startup_time": False,
+            "startup_budget_ms": 250,
+            "punch_price": 9,
+            "shared_punchcards": [],
             "cc_purchase": ["*********@gmail.com", "*********@gmail.com"],
             "cc_invite": [],            
             "cc_punchused": [],
@@ -43,6 +51,7 @@ class CInfo:
     def loadInfoFile(self):
         """Load the information file if it exists, otherwise create a new one with default values."""
         if os.path.exists(self.infoFilename):
+            countFileLoad("info.json")
             with open(self.infoFilename, 'r') as file:
                 try:
                     self.info = json.load(file)
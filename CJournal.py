@@ -0,0 +1,94 @@
+import os
+import json
+from utils import *
+
+#-------------------------------------------------------------------------------
+class CJournal:
+    """Append-only journal of changes made to one of the tab separated data files.
+
+    Each change is one JSON line. The first line records the size and modification time of the data file the journal
+    applies to, so a journal left over from before a compaction (or a data file hand edited in Excel/LibreOffice since
+    the journal was started) is detected and not replayed twice.
+    """
+    def __init__(self, name, sourceFile):
+        self.path = getHockeyPath()
+        self.journalFilename = os.path.join(self.path, name + ".journal")
+        self.sourceFilename = os.path.join(self.path, sourceFile)
+        self.pending = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def _sourceSignature(self):
+        stat = os.stat(self.sourceFilename)
+        return {"source": os.path.basename(self.sourceFilename), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    #-------------------------------------------------------------------------------
+    def replay(self):
+        """Return the list of changes recorded since the data file was last written"""
+        self.count = 0
+        if not os.path.exists(self.journalFilename):
+            return []
+        records = []
+        with open(self.journalFilename, 'r', encoding='utf-8') as file:
+            header = file.readline()
+            try:
+                header = json.loads(header)
+            except ValueError:
+                header = None
+            if header != self._sourceSignature():
+                staleFilename = self.journalFilename + ".stale"
+                print(f"ERROR 711: {os.path.basename(self.sourceFilename)} has changed since {os.path.basename(self.journalFilename)} was started.")
+                print(f"           The journal was NOT applied. It has been saved as {staleFilename}")
+                file.close()
+                os.replace(self.journalFilename, staleFilename)
+                return []
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # a crash while appending can leave a partial last line, which was never acknowledged
+                    print(f"WARNING 712: Ignoring incomplete record at the end of {self.journalFilename}")
+                    break
+        self.count = len(records)
+        return records
+
+    #-------------------------------------------------------------------------------
+    def append(self, record):
+        """Queue a change. It is written to disk by the next flush()."""
+        self.pending.append(record)
+
+    #-------------------------------------------------------------------------------
+    def flush(self):
+        """Append the queued changes to the journal and fsync it"""
+        if len(self.pending) == 0:
+            return
+        newFile = not os.path.exists(self.journalFilename)
+        with open(self.journalFilename, 'a', encoding='utf-8') as file:
+            if newFile:
+                file.write(json.dumps(self._sourceSignature()) + "\n")
+            for record in self.pending:
+                file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.count += len(self.pending)
+        self.pending = []
+
+    #-------------------------------------------------------------------------------
+    def discard(self):
+        """Drop changes that were queued but not yet flushed"""
+        self.pending = []
+
+    #-------------------------------------------------------------------------------
+    def reset(self):
+        """Remove the journal once its changes have been compacted into the data file"""
+        self.pending = []
+        self.count = 0
+        if os.path.exists(self.journalFilename):
+            os.remove(self.journalFilename)
@@ -0,0 +1,136 @@
+import os
+import json
+from datetime import datetime
+from CInfo import CInfo
+from utils import *
+
+# age of a punchcard (days since purchase) -> bucket label, oldest last
+AGE_BUCKETS = [(90, "under 3 months"), (180, "3-6 months"), (365, "6-12 months"), (None, "over a year")]
+
+#-------------------------------------------------------------------------------
+def sourceSignature(path):
+    """Size and modification time of the punchcard data files, used to tell if liability.json is current"""
+    signature = {}
+    for filename in ("punchcards.csv", "punchcards.journal", "hockey.db", "hockey.db-wal"):
+        filepath = os.path.join(path, filename)
+        if os.path.exists(filepath):
+            stat = os.stat(filepath)
+            signature[filename] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+#-------------------------------------------------------------------------------
+class CLiability:
+    """Prepaid punches not yet used (empty slots on 'curr' and 'next' punchcards), i.e. what the club owes its players.
+
+    CPunchcards keeps one of these up to date as cards are bought, punched and refunded, so the totals are always
+    available without scanning the punchcards. It is saved to liability.json whenever punchcards.csv (or the journal) is
+    written, so the treasurer's report can be printed without loading punchcards.csv at all.
+
+    cards: punchcard row index -> [Hockey User ID, Meetup name, purchase date, punches remaining]
+    """
+    def __init__(self, info=None):
+        self.path = getHockeyPath()
+        self.ledgerFilename = os.path.join(self.path, "liability.json")
+        self.info = info if info is not None else CInfo()
+        self.cards = {}
+        self.players = {}
+        self.total = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def addCard(self, rowidx, hockeyID, meetupName, purchaseDate, remaining):
+        self.cards[rowidx] = [hockeyID, meetupName, purchaseDate, 0]
+        self.adjust(rowidx, remaining)
+
+    #-------------------------------------------------------------------------------
+    def removeCard(self, rowidx):
+        if rowidx in self.cards:
+            self.adjust(rowidx, -self.cards[rowidx][3])
+            del self.cards[rowidx]
+
+    #-------------------------------------------------------------------------------
+    def adjust(self, rowidx, delta):
+        """Change the punches remaining on one card (-1 for a punch)"""
+        card = self.cards.get(rowidx)
+        if card is None or delta == 0:
+            return
+        card[3] += delta
+        self.players[card[0]] = self.players.get(card[0], 0) + delta
+        if self.players[card[0]] == 0:
+            del self.players[card[0]]
+        self.total += delta
+
+    #-------------------------------------------------------------------------------
+    def price(self):
+        # info.json files written before "punch_price" was added don't have it
+        return self.info.getValue("punch_price") or 9
+
+    #-------------------------------------------------------------------------------
+    def playerNames(self):
+        return {card[0]: card[1] for card in self.cards.values()}
+
+    #-------------------------------------------------------------------------------
+    def aged(self, today=None):
+        """Return {bucket label: punches remaining} by the age of the punchcard they're on"""
+        today = today or datetime.now()
+        buckets = {label: 0 for _, label in AGE_BUCKETS}
+        buckets["unknown purchase date"] = 0
+        for _, _, purchaseDate, remaining in self.cards.values():
+            try:
+                age = (today - datetime.strptime(purchaseDate, "%m/%d/%Y")).days
+            except ValueError:
+                buckets["unknown purchase date"] += remaining
+                continue
+            for days, label in AGE_BUCKETS:
+                if days is None or age < days:
+                    buckets[label] += remaining
+                    break
+        return buckets
+
+    #-------------------------------------------------------------------------------
+    def save(self, signature):
+        ledger = {"source": signature, "total": self.total, "players": self.players,
+                  "cards": [card for card in self.cards.values() if card[3] != 0]}
+        with open(self.ledgerFilename + ".tmp", 'w') as file:
+            json.dump(ledger, file)
+        replaceFileAtomic(self.ledgerFilename + ".tmp", self.ledgerFilename)
+
+    #-------------------------------------------------------------------------------
+    @classmethod
+    def load(cls, info=None):
+        """Return the ledger saved in liability.json, or None if it's missing or punchcards.csv has changed since"""
+        liability = cls(info)
+        if not os.path.exists(liability.ledgerFilename):
+            return None
+        try:
+            with open(liability.ledgerFilename, 'r') as file:
+                ledger = json.load(file)
+        except ValueError:
+            return None
+        if ledger.get("source") != sourceSignature(liability.path):
+            return None
+        for rowidx, card in enumerate(ledger["cards"]):
+            liability.addCard(rowidx, *card)
+        return liability
+
+    #-------------------------------------------------------------------------------
+    def printReport(self, detail=True):
+        price = self.price()
+        print()
+        print(self.total, f"prepaid, but not yet used, punches.  Total value (at ${price:.2f} each) is   $", self.total * price)
+        print("\nBy age of punchcard")
+        for label, count in self.aged().items():
+            if count > 0:
+                print(f"   {label:22s} {count:5d}   ${count * price:.2f}")
+        if detail:
+            print("\nBy player")
+            names = self.playerNames()
+            for hockeyID, count in sorted(self.players.items(), key=lambda item: item[1], reverse=True):
+                print(f"   {names[hockeyID]:30s} {count:5d}   ${count * price:.2f}")
+        return
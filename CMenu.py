@@ -1,8 +1,12 @@
+import time
+STARTUP_START = time.perf_counter()     # taken before the other imports, so checkStartupTime() can include them
 import datetime
-from CGameDay import CGameDay
-from CPunchcards import CPunchcards
-from CRoster import CRoster
-from CEmail import CEmail
+from CGameDay import CGameDay, analyzeDateRange
+from CReportCache import CReportCache
+from CUnitOfWork import CUnitOfWork
+from CSession import CSession
+from CInfo import CInfo
+from CLiability import CLiability
 from utils import *
 from readAttendees import *
 
@@ -20,6 +24,18 @@ class CMenu:
         # close, deallocate, etc
         pass
     
+    #-------------------------------------------------------------------------------               
+    def checkStartupTime(self, info):
+        """Warn if getting to the first menu prompt took longer than info.json's startup_budget_ms. Modules that are
+        slow to import (numpy, smtplib, bs4, psutil, ...) should be imported by the menu action that needs them."""
+        elapsed = (time.perf_counter() - STARTUP_START) * 1000
+        budget = info.getValue("startup_budget_ms") or 250
+        if elapsed > budget:
+            print(f"WARNING 781: Startup took {elapsed:.0f} ms, over the budget of {budget} ms.")
+            print("             Run 'python -X importtime CMenu.py' to see which imports are slow.")
+        elif info.getValue("show_startup_time"):
+            print(f"INFO 782: Startup took {elapsed:.0f} ms (budget {budget} ms)")
+
     #-------------------------------------------------------------------------------               
     def getMenuChoice(self):
         print()
@@ -41,17 +57,26 @@ class CMenu:
         print("8. Punchcard purchase")
         print("9. Send past-due notices")
         print("A. Prepaid counts")
+        print("B. Attendance by date")
+        print("C. Archive old punchcards")
+        print("D. Refund a punchcard")
+        print("E. Charge punchcards for all games in a date range")
+        print("F. Attendance trends from all game files")
         print()
         choice = input("Enter selection (or <enter> to quit) ")
         return choice
 
     #-------------------------------------------------------------------------------               
     def doMenu(self):
+        self.checkStartupTime(CInfo())
         choice = "1"
         while len(choice) > 0:
             
             choice = self.getMenuChoice()
             
+            # every action gets one freshly loaded copy of the data files, shared by everything it calls
+            session = CSession()
+            
             # move game date back one day   
             if choice == "-":    
                 self.gamedate -= datetime.timedelta(days=1)
@@ -90,65 +115,123 @@ class CMenu:
             
             # display list of attendees from last practice
             elif choice == "2":
-                g = CGameDay(self.gamedate.strftime('%Y%m%d'))
+                g = CGameDay(self.gamedate.strftime('%Y%m%d'), session)
                 if g.isValid():                    
                     g.printGameDay()  
             
             # charge punchcards for current game
             elif choice == "3":
-                g = CGameDay(self.gamedate.strftime('%Y%m%d'))
+                g = CGameDay(self.gamedate.strftime('%Y%m%d'), session)
                 if g.isValid():   
                     g.analyze()   
                     
             # charge punchcards for current game
             elif choice == "4":
-                pc = CPunchcards()
+                pc = session.punchcards
                 pc.manualPunch(self.gamedate.strftime('%Y%m%d'), 20)
 
             # charge half of a punch for current game
             elif choice.upper() == "H":
-                pc = CPunchcards()
+                pc = session.punchcards
                 pc.manualPunch(self.gamedate.strftime('%Y%m%d'), 10)                
 
             # send invitational email to new player
             elif choice == "5":
-                email = CEmail()
+                email = session.email
                 email.sendInvitationalEmail()
 
             # Add new player from current game                    
             elif choice == "6":                    
-                g = CGameDay(self.gamedate.strftime('%Y%m%d'))
+                g = CGameDay(self.gamedate.strftime('%Y%m%d'), session)
                 if g.isValid():
                     g.addPlayerToRoster()
 
             # display player information
             elif choice == "7":
-                    r = CRoster()
+                    r = session.roster
                     r.printRoster()                    
                     playerRec = r.getPlayerName()
                     if not playerRec is None:        
                         print("Player record: ", playerRec)
+                        print("Punchcards (current, then history):")
+                        for row in session.punchcards.getPlayerCards(playerRec[r.R_HOCKEYUSERID]):
+                            print("   ", ' '.join(row))
+                        r.playHistory(playerRec, session.attendance)
                         
             # purchase punchcard
             elif choice == "8":
-                pc = CPunchcards()
-                pc.addPunchcards()
-                pc._savePunchcards()    
+                pc = session.punchcards
+                with CUnitOfWork(pc, email=session.email):
+                    pc.addPunchcards()
             
             # send pastdue notices
             elif choice == "9":
-                pc = CPunchcards()
+                pc = session.punchcards
                 pc.sendPastDueNotices()      
 
             # purchase punchcard
             elif choice == "A" or choice == "a":
-                pc = CPunchcards()   
-                pc.countGamesPlayedInYear()       
-                x = pc.countPrepaymentPunches()
-                print()
-                print(x, "prepaid, but not yet used, punches.  Total value (at $9.00 each) is   $", x*9)
+                enddate = self.gamedate.strftime('%Y%m%d')
+                startdate = input(f"Start date YYYYMMDD (or <enter> for {enddate[:4]}0101) ").strip()
+                if len(startdate) == 0:
+                    startdate = enddate[:4] + "0101"
+                # the report cache answers whole-month ranges without re-reading unchanged files
+                cache = CReportCache(session) if session.database is None else None
+                if cache is not None and cache.canAnswer(startdate, enddate):
+                    cache.printReport(startdate, enddate)
+                else:
+                    from CAnalytics import CAnalytics       # numpy, so only imported when it's needed
+                    CAnalytics(session.punchcards, startdate, enddate).printReport(startdate, enddate)
+                # the liability ledger saved with punchcards.csv, or the live one if punchcards.csv changed since
+                liability = CLiability.load(session.info) or session.punchcards.liability
+                liability.printReport(detail=False)
                 print()
+
+            # attendance by date, from the punchcard ledger
+            elif choice == "B" or choice == "b":
+                enddate = self.gamedate.strftime('%Y%m%d')
+                startdate = input(f"Start date YYYYMMDD (or <enter> for {enddate}) ").strip()
+                if len(startdate) == 0:
+                    startdate = enddate
+                pc = session.punchcards
+                pc.printAttendanceByDate(startdate, enddate)
+
+            # move used-up punchcards to the yearly history files
+            elif choice == "C" or choice == "c":
+                if input("Move used-up punchcards last punched over 2 months ago to the history files? (y/n) ").strip().upper() == "Y":
+                    pc = session.punchcards
+                    pc.archivePunchcards(months=2)
+                else:
+                    print("Nothing done")
+
+            # refund the unused punches on a punchcard
+            elif choice == "D" or choice == "d":
+                pc = session.punchcards
+                with CUnitOfWork(pc):
+                    pc.refundPunchcard()
+
+            # catch up on several games at once (e.g. after a holiday), ending on the current game date
+            elif choice == "E" or choice == "e":
+                enddate = self.gamedate.strftime('%Y%m%d')
+                startdate = input(f"Start date YYYYMMDD (or <enter> for {enddate}) ").strip()
+                if len(startdate) == 0:
+                    startdate = enddate
+                dates = session.attendance.getGameDates(startdate, enddate)
+                print(f"Game files from {startdate} to {enddate}: {' '.join(dates) if len(dates) > 0 else 'none'}")
+                if len(dates) > 0 and input("Charge punchcards for these games? (y/n) ").strip().upper() == "Y":
+                    analyzeDateRange(startdate, enddate, session)
+
+            # attendance and early bird trends over the whole games/ archive
+            elif choice == "F" or choice == "f":
+                session.attendance.printReport()
+            
+            session.printFileLoads()
     
+        # in journal mode, fold the day's changes back into the csv files on the way out
+        session = CSession()
+        if session.info.getValue("use_journal"):
+            session.punchcards.compactJournal()
+            session.roster.compactJournal()
         return              
             
 #-------------------------------------------------------------------------------           
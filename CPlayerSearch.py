@@ -0,0 +1,166 @@
+import re
+from bisect import bisect_left, insort
+
+# columns of a roster record that are searched (CRosterRecord attribute names)
+SEARCH_FIELDS = ("hockeyID", "meetupName", "first", "last", "email", "textPhone", "altPhone")
+PHONE_FIELDS = {"textPhone", "altPhone"}
+
+# per query word: whole word, start of a word, anywhere in a field, and (scaled by similarity) a near miss.
+# A word that is all digits (a phone number or Hockey ID) only matches the start of a token: numbers that merely
+# share digits, e.g. an area code, aren't near misses.
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.9
+SUBSTRING_SCORE = 0.8
+FUZZY_SCORE = 0.7
+FUZZY_THRESHOLD = 0.4           # minimum trigram similarity (Dice coefficient) for a near miss
+
+#-------------------------------------------------------------------------------
+def normalizeWords(text):
+    """Lower case words of a name, email or query. Phone numbers are kept as one run of digits."""
+    return [word for word in re.split(r"[^0-9a-z]+", text.lower()) if len(word) > 0]
+
+#-------------------------------------------------------------------------------
+def normalizeQuery(text):
+    """Words of a search. A query that looks like a phone number, e.g. (555) 123-4567, is one run of digits."""
+    if re.fullmatch(r"[0-9()+.\s-]*[0-9][0-9()+.\s-]*", text):
+        return [re.sub(r"[^0-9]", "", text)]
+    return normalizeWords(text)
+
+#-------------------------------------------------------------------------------
+def trigrams(word):
+    padded = "  " + word + " "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+#-------------------------------------------------------------------------------
+class CPlayerSearch:
+    """Prefix and trigram index over the roster's Hockey IDs, Meetup names, first and last names, emails and phone
+    numbers.
+
+    Every word of those fields is a token. tokens is kept sorted so the tokens starting with a query word are one bisect
+    away, and trigramTokens maps each trigram to the tokens containing it, for substring and misspelled matches.
+    search() scores each query word against a player's tokens and ranks the players that match every word.
+    """
+    def __init__(self, roster=None):
+        self.tokens = []            # sorted list of distinct tokens
+        self.tokenPlayers = {}      # token -> set of Hockey User IDs
+        self.trigramTokens = {}     # trigram -> set of tokens
+        self.trigramCounts = {}     # token -> number of trigrams in it
+        self.haystacks = {}         # Hockey User ID -> normalized searchable text, for substring checks
+        self.records = {}           # Hockey User ID -> roster record
+        for record in (roster or {}).values():
+            self.add(record, keepSorted=False)
+        self.tokens.sort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def _playerTokens(self, record):
+        tokens = set()
+        for field in SEARCH_FIELDS:
+            value = str(getattr(record, field))
+            if field in PHONE_FIELDS:
+                digits = re.sub(r"[^0-9]", "", value)
+                if len(digits) > 0:
+                    tokens.add(digits)
+            else:
+                tokens.update(normalizeWords(value))
+        return tokens
+
+    #-------------------------------------------------------------------------------
+    def add(self, record, keepSorted=True):
+        """Index a player (or re-index one whose searchable fields have changed)"""
+        hockeyID = record.hockeyID
+        if hockeyID in self.records:
+            self.remove(hockeyID)
+        tokens = self._playerTokens(record)
+        for token in tokens:
+            players = self.tokenPlayers.get(token)
+            if players is None:
+                players = self.tokenPlayers[token] = set()
+                if keepSorted:
+                    insort(self.tokens, token)
+                else:
+                    self.tokens.append(token)
+                tokenTrigrams = trigrams(token)
+                self.trigramCounts[token] = len(tokenTrigrams)
+                for trigram in tokenTrigrams:
+                    self.trigramTokens.setdefault(trigram, set()).add(token)
+            players.add(hockeyID)
+        self.haystacks[hockeyID] = " ".join(sorted(tokens))
+        self.records[hockeyID] = record
+
+    #-------------------------------------------------------------------------------
+    def remove(self, hockeyID):
+        self.records.pop(hockeyID, None)
+        for token in self.haystacks.pop(hockeyID, "").split():
+            players = self.tokenPlayers.get(token)
+            if players is None:
+                continue
+            players.discard(hockeyID)
+            if len(players) == 0:
+                del self.tokenPlayers[token]
+                del self.tokens[bisect_left(self.tokens, token)]
+                del self.trigramCounts[token]
+                for trigram in trigrams(token):
+                    self.trigramTokens[trigram].discard(token)
+
+    #-------------------------------------------------------------------------------
+    def _scoreWord(self, word):
+        """Return {Hockey User ID: best score of this query word against the player's tokens}"""
+        scores = {}
+        def credit(players, score):
+            for hockeyID in players:
+                if scores.get(hockeyID, 0) < score:
+                    scores[hockeyID] = score
+
+        # tokens starting with the word
+        idx = bisect_left(self.tokens, word)
+        while idx < len(self.tokens) and self.tokens[idx].startswith(word):
+            token = self.tokens[idx]
+            credit(self.tokenPlayers[token], EXACT_SCORE if token == word else PREFIX_SCORE)
+            idx += 1
+        if word.isdigit():
+            return scores
+
+        # tokens containing the word or sharing most of its trigrams
+        wordTrigrams = trigrams(word)
+        shared = {}
+        for trigram in wordTrigrams:
+            for token in self.trigramTokens.get(trigram, ()):
+                shared[token] = shared.get(token, 0) + 1
+        for token, count in shared.items():
+            if word in token:
+                credit(self.tokenPlayers[token], SUBSTRING_SCORE)
+                continue
+            similarity = 2.0 * count / (len(wordTrigrams) + self.trigramCounts[token])
+            if similarity >= FUZZY_THRESHOLD:
+                credit(self.tokenPlayers[token], FUZZY_SCORE * similarity)
+
+        # short words have too few trigrams to find them inside longer tokens
+        if len(word) < 3:
+            credit([hockeyID for hockeyID, haystack in self.haystacks.items() if word in haystack and hockeyID not in scores],
+                   SUBSTRING_SCORE)
+        return scores
+
+    #-------------------------------------------------------------------------------
+    def search(self, text, limit=None):
+        """Return the roster records matching every word of text, best match first"""
+        words = normalizeQuery(text)
+        if len(words) == 0:
+            return []
+        totals = None
+        for word in words:
+            scores = self._scoreWord(word)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {hockeyID: totals[hockeyID] + score for hockeyID, score in scores.items() if hockeyID in totals}
+            if len(totals) == 0:
+                return []
+        ranked = sorted(totals, key=lambda hockeyID: (-totals[hockeyID], self.records[hockeyID].meetupName.upper()))
+        return [self.records[hockeyID] for hockeyID in ranked[:limit]]
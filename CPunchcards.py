@@ -1,18 +1,93 @@
 import os
 import sys
 import csv
-from datetime import datetime
+import bisect
+import json
+from datetime import datetime, timedelta
 import CRoster
 import CEmail
+import CSession
 from CInfo import CInfo
+from CRecords import CPunchcardRecord, DATE_EMPTY, DATE_NULL, STATUS_NAMES, decodeDate
+from CJournal import CJournal
+from CSnapshot import CSnapshot
+from CDatabase import CDatabaseLog
+from CHistoryReader import CHistoryReader
+from CUnitOfWork import CUnitOfWork
+from CLiability import CLiability, sourceSignature
 from utils import *
 sys.path.append("\\")
 
 VALID_STATUSES = {"curr", "next", "prev", "pastdue", "REFUNDED"}
 
+#-------------------------------------------------------------------------------
+def loadHistoryManifest(path):
+    """punchcards_history.json lists each yearly history file with its card count and first/last play date"""
+    filepath = os.path.join(path, "punchcards_history.json")
+    if not os.path.exists(filepath):
+        return {"partitions": {}}
+    with open(filepath, 'r') as file:
+        return json.load(file)
+
+#-------------------------------------------------------------------------------
+def historyPartitions(path, startdate = '', enddate = ''):
+    """Return the yearly history files holding any play dates between startdate and enddate (inclusive)"""
+    manifest = loadHistoryManifest(path)
+    filenames = []
+    for year in sorted(manifest["partitions"]):
+        partition = manifest["partitions"][year]
+        if len(startdate) > 0 and partition["lastDate"] < startdate:
+            continue
+        if len(enddate) > 0 and partition["firstDate"] > enddate:
+            continue
+        filenames.append(partition["file"])
+    return filenames
+
+#-------------------------------------------------------------------------------
+def findDuplicateCharges(sources, low, high, shared, getAttendees):
+    """Return [(Hockey User ID, date, [(source, punchcard row, slot), ...]), ...] for everyone charged more than once
+    on a day between low and high (YYYYMMDD ints, inclusive).
+
+    sources is [(name, punchcard rows), ...]. A punch may be for the card's owner or its alt payer, so it is indexed
+    under both: (player, date) -> every punch that could have been theirs that day, from all of their cards. More than
+    one is only fine when each punch can be put down to a different player who was at the game (getAttendees(date)
+    returns their Hockey User IDs) and is the owner or alt payer of the card it's on, e.g. a card's owner and alt both
+    playing. Players and card owners listed in shared (the "shared_punchcards" info setting) are not reported.
+    """
+    charges = {}
+    for source, rows in sources:
+        for row in rows:
+            players = (row.hockeyID, row.altID) if len(row.altID) > 0 and row.altID != row.hockeyID else (row.hockeyID,)
+            for slot, code in enumerate(row.dates):
+                if low <= code <= high:
+                    for player in players:
+                        charges.setdefault((player, code), []).append((source, row, slot))
+
+    duplicates = {}
+    for (player, code), occurrences in charges.items():
+        if len(occurrences) < 2 or player in shared or all(row.hockeyID in shared for source, row, slot in occurrences):
+            continue
+        if _punchesExplained(occurrences, getAttendees(str(code))):
+            continue
+        # a card's extra punches are indexed under its owner and its alt; report them once, under the owner
+        key = frozenset((id(row), slot) for source, row, slot in occurrences)
+        if key not in duplicates or player == occurrences[0][1].hockeyID:
+            duplicates[key] = (player, str(code), occurrences)
+    return sorted(duplicates.values(), key=lambda duplicate: (duplicate[1], duplicate[0]))
+
+#-------------------------------------------------------------------------------
+def _punchesExplained(occurrences, attendees, used = frozenset()):
+    """True if each punch can be for a different player, not in used, who played and owns or is alt payer of its card"""
+    if len(occurrences) == 0:
+        return True
+    source, row, slot = occurrences[0]
+    return any(_punchesExplained(occurrences[1:], attendees, used | {player})
+               for player in (row.hockeyID, row.altID)
+               if len(player) > 0 and player in attendees and player not in used)
+
 #-------------------------------------------------------------------------------
 class CPunchcards:
-    def __init__(self):
+    def __init__(self, session=None):
         self.path = getHockeyPath()
         self.P_HOCKEYUSERID = 0
         self.P_MEETUPNAME = 1
@@ -21,16 +96,42 @@ class CPunchcards:
         self.P_PURCHASEDATE = 5
         self.firstPaySlot = 6
         self.totalSlotCount = 11     
-        self.info = CInfo()
+        self.session = session if session is not None else CSession.CSession()
+        self.session.attach(self)
+        self.info = self.session.info
         self.useStars = self.info.getValue("use_stars")
+        self.database = self.session.database      # None unless info.json selects the sqlite storage backend
+        
+        # in journal mode, changes since punchcards.csv was last written are replayed from punchcards.journal
+        # with the sqlite backend the same change records are written straight to hockey.db instead
+        self.journal = None
+        if self.database is not None:
+            self.journal = CDatabaseLog(lambda records: self.database.applyPunchcardChanges(records, self.cardIDs))
+        elif self.info.getValue("use_journal"):
+            self.journal = CJournal("punchcards", "punchcards.csv")
+        
         self.punchcards = []
-        self.punchcards = self.loadPunchcards()
-        self.punchcardFileHeader = ["Hockey User ID", "Meetup name", "Alt ID", "Alt name", "Status", "PurchaseDate"] + \
-            [f"PlayDate{str(i).zfill(2)}" for i in range(1, self.totalSlotCount + 1)]
+        if self.database is not None:
+            cards = self.database.loadPunchcards()
+            self.cardIDs = [cardID for cardID, _ in cards]      # hockey.db id of each row of self.punchcards
+            self.punchcards = [row for _, row in cards]
+        else:
+            self.punchcards = self.loadPunchcards()
+        self.punchcardFileHeader = list(CPunchcardRecord.FILE_HEADER)
         
         # Calculate column indices dynamically
         self._calculateColumnIndices()   
         
+        # set while a CUnitOfWork session is open: saves are held until the session commits
+        self.deferSave = False
+        
+        # players whose cards changed since the last validation (None = not validated yet, so check everyone)
+        self.touchedPlayers = None
+        self.roster = None
+        
+        # lookup indexes over self.punchcards, kept up to date by every mutation
+        self._buildIndexes()
+        
     def __enter__(self):
         return self
     
@@ -57,38 +158,334 @@ class CPunchcards:
         if len(self.PLAY_DATE_INDICES) != self.totalSlotCount:
             raise ValueError(f"Expected {self.totalSlotCount} PlayDate columns, found {len(self.PLAY_DATE_INDICES)}")
     
+    #-------------------------------------------------------------------------------
+    def _buildIndexes(self):
+        """Build the lookup indexes over self.punchcards
+        
+        playerIndex: (Hockey User ID, status) -> sorted list of row indices
+        altIndex:    (Alt ID, status) -> sorted list of row indices
+        statusIndex: status -> set of row indices
+        dateIndex:   play date -> list of (row index, slot) punched on that date
+        liability:   CLiability, the unused punches on 'curr' and 'next' cards
+        
+        Row indices change whenever self.punchcards is re-sorted, so the indexes must be rebuilt after a sort.
+        """
+        self.playerIndex = {}
+        self.altIndex = {}
+        self.statusIndex = {status: set() for status in VALID_STATUSES}
+        self.dateIndex = {}
+        self.liability = CLiability(self.info)
+        for rowidx in range(len(self.punchcards)):
+            self._indexRow(rowidx)
+            self._indexDates(rowidx)
+
+    #-------------------------------------------------------------------------------
+    def _indexDates(self, rowidx):
+        """Add the punched play dates of a single row of self.punchcards to the date index"""
+        dateIndex = self.dateIndex
+        for slot, code in enumerate(self.punchcards[rowidx].dates):
+            if code != DATE_EMPTY and code != DATE_NULL:
+                dateIndex.setdefault(decodeDate(code), []).append((rowidx, slot))
+
+    #-------------------------------------------------------------------------------
+    def _indexRow(self, rowidx):
+        """Add a single row of self.punchcards to the lookup indexes"""
+        row = self.punchcards[rowidx]
+        status = STATUS_NAMES[row.status]
+        bisect.insort(self.playerIndex.setdefault((row.hockeyID, status), []), rowidx)
+        if len(row.altID) > 0:
+            bisect.insort(self.altIndex.setdefault((row.altID, status), []), rowidx)
+        self.statusIndex.setdefault(status, set()).add(rowidx)
+        if status == "curr" or status == "next":
+            self._addLiability(rowidx)
+
+    #-------------------------------------------------------------------------------
+    def _addLiability(self, rowidx):
+        row = self.punchcards[rowidx]
+        self.liability.addCard(rowidx, row.hockeyID, row.meetupName, row.purchaseDate, row.dates.count(DATE_EMPTY))
+
+    #-------------------------------------------------------------------------------
+    def _unindexRow(self, rowidx):
+        """Remove a single row of self.punchcards from the lookup indexes"""
+        row = self.punchcards[rowidx]
+        status = row[self.P_STATUS]
+        self.playerIndex[(row[self.P_HOCKEYUSERID], status)].remove(rowidx)
+        if len(row[self.P_ALTPAYERID]) > 0:
+            self.altIndex[(row[self.P_ALTPAYERID], status)].remove(rowidx)
+        self.statusIndex[status].discard(rowidx)
+        self.liability.removeCard(rowidx)
+
+    #-------------------------------------------------------------------------------
+    def _appendPunchcard(self, row):
+        """Append a new punchcard row and add it to the lookup indexes. Returns the new row index."""
+        self.punchcards.append(row)
+        rowidx = len(self.punchcards) - 1
+        self._indexRow(rowidx)
+        self._indexDates(rowidx)
+        self._touch(row.hockeyID)
+        self._journal({"op": "card", "fields": row.toRow()})
+        return rowidx
+
+    #-------------------------------------------------------------------------------
+    def _setStatus(self, rowidx, status):
+        """Change the status of a punchcard row, keeping the lookup indexes in step"""
+        if self.punchcards[rowidx][self.P_STATUS] == status:
+            return
+        self._unindexRow(rowidx)
+        self.punchcards[rowidx][self.P_STATUS] = status
+        self._indexRow(rowidx)
+        self._touch(self.punchcards[rowidx].hockeyID)
+        self._journal({"op": "status", "row": rowidx, "status": status})
+
+    #-------------------------------------------------------------------------------
+    def _touch(self, player):
+        if self.touchedPlayers is not None:
+            self.touchedPlayers.add(player)
+
+    #-------------------------------------------------------------------------------
+    def _setField(self, rowidx, col, value):
+        """Change a column that isn't used by the lookup indexes (Meetup name, purchase date)"""
+        self.punchcards[rowidx][col] = value
+        if rowidx in self.liability.cards:
+            self.liability.removeCard(rowidx)
+            self._addLiability(rowidx)
+        self._journal({"op": "set", "row": rowidx, "col": col, "value": value})
+
+    #-------------------------------------------------------------------------------
+    def _journal(self, record):
+        if self.journal is not None:
+            self.journal.append(record)
+
+    #-------------------------------------------------------------------------------
+    def _replayJournal(self, records, punchcardList):
+        """Apply journaled changes to rows just loaded from punchcards.csv (before any indexes are built on them)"""
+        for record in records:
+            op = record["op"]
+            if op == "card":
+                punchcardList.append(CPunchcardRecord.fromRow(record["fields"]))
+            elif op == "punch":
+                punchcardList[record["row"]][self.slotIdx(record["slot"])] = record["date"]
+            elif op == "status":
+                punchcardList[record["row"]][self.P_STATUS] = record["status"]
+            elif op == "set":
+                punchcardList[record["row"]][record["col"]] = record["value"]
+            else:
+                print("ERROR 713: Unknown punchcard journal record", record)
+
     #-------------------------------------------------------------------------------    
-    def loadPunchcards(self, includeHistory = False):
+    def loadPunchcards(self, includeHistory = False, startdate = '', enddate = ''):
+        # startdate/enddate (YYYYMMDD) limit the history to the cards with a play date in the range (see _loadHistory).
+        # Those cards keep all their punches, so callers still check the play dates themselves.
+        
+        if self.database is not None:
+            punchcardList = [row for _, row in self.database.loadPunchcards()]
+        else:
+            punchcardList = self._readPunchcardFile(os.path.join(self.path, "punchcards.csv"))
+            # in journal mode punchcards.csv is only up to date once the journal (saved and still queued) is applied
+            if isinstance(self.journal, CJournal):
+                self._replayJournal(self.journal.replay() + self.journal.pending, punchcardList)
+        if includeHistory:
+            punchcardList += self._loadHistory(startdate, enddate)
+        return punchcardList
+
+    #-------------------------------------------------------------------------------    
+    def _loadHistory(self, startdate = '', enddate = '', player = ''):
+        # with a date range or player, only the matching rows of each history file are read (see CHistoryReader)
+        
+        if self.database is not None:
+            return self.database.loadHistory(startdate, enddate, player)
+        # cards archived before the history was split by year
+        filenames = [filename for filename in ["punchcards_history.csv"] if os.path.exists(os.path.join(self.path, filename))]
+        filenames += self._historyPartitions(startdate, enddate)
         
         punchcardList = []
-        filepaths = [os.path.join(self.path, "punchcards.csv")]
+        for filename in filenames:
+            if len(startdate) == 0 and len(enddate) == 0 and len(player) == 0:
+                punchcardList += self._readPunchcardFile(os.path.join(self.path, filename))
+            else:
+                punchcardList += CHistoryReader(filename).rows(startdate, enddate, player)
+        return punchcardList
+
+    #-------------------------------------------------------------------------------    
+    def getPlayerCards(self, player, includeHistory = True):
+        """Return every punchcard of the player (or that lists them as alt payer), current ones first"""
+        rowidxs = sorted(rowidx for index in (self.playerIndex, self.altIndex) for status in self.statusIndex
+                         for rowidx in index.get((player, status), []))
+        cards = [self.punchcards[rowidx] for rowidx in rowidxs]
         if includeHistory:
-            filepaths.append(os.path.join(self.path, "punchcards_history.csv"))
-        for filepath in filepaths:
-            with open(filepath, newline='') as csvfile:
-                rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
-                next(rows)
-                for row in rows:
-                    if len(row) > 0:
-                        if row[self.P_STATUS] not in VALID_STATUSES:
-                            print("ERROR 636: Card status must be 'curr', 'next', or 'prev' or 'pastdue' (not '" + row[self.P_STATUS] + "')")
-                            print(row)                      
-                        punchcardList.append(row)
+            cards += self._loadHistory(player=player)
+        return cards
+
+    #-------------------------------------------------------------------------------    
+    def _loadHistoryManifest(self):
+        return loadHistoryManifest(self.path)
+
+    #-------------------------------------------------------------------------------    
+    def _historyPartitions(self, startdate = '', enddate = ''):
+        return historyPartitions(self.path, startdate, enddate)
+
+    #-------------------------------------------------------------------------------    
+    def _historyYear(self, row):
+        # by the year of the card's last punch. A card that was never punched goes in by its purchase year (MM/DD/YYYY)
+        year = str(max(row.dates))[:4] if max(row.dates) > 0 else row.purchaseDate[-4:]
+        return year if len(year) == 4 and year.isdigit() else "0000"
+
+    #-------------------------------------------------------------------------------    
+    def _appendToHistory(self, rows):
+        """Append finished cards to punchcards_history_YYYY.csv, by the year of each card's last punch, and update the manifest"""
+        
+        manifest = self._loadHistoryManifest()
+        byYear = {}
+        for row in rows:
+            byYear.setdefault(self._historyYear(row), []).append(row)
+        for year, yearRows in sorted(byYear.items()):
+            filename = f"punchcards_history_{year}.csv"
+            filepath = os.path.join(self.path, filename)
+            newFile = not os.path.exists(filepath)
+            with open(filepath, 'a', newline='') as csvfile:
+                writer = csv.writer(csvfile, delimiter='\t', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                if newFile:
+                    writer.writerow(self.punchcardFileHeader)
+                writer.writerows(yearRows)
+            dates = [str(code) for row in yearRows for code in row.dates if code > 0] or [year + "0101"]
+            partition = manifest["partitions"].setdefault(year, {"file": filename, "cards": 0, "firstDate": min(dates), "lastDate": max(dates)})
+            partition["cards"] += len(yearRows)
+            partition["firstDate"] = min(partition["firstDate"], min(dates))
+            partition["lastDate"] = max(partition["lastDate"], max(dates))
+        with open(os.path.join(self.path, "punchcards_history.json"), 'w') as file:
+            json.dump(manifest, file, indent=4)
+
+    #-------------------------------------------------------------------------------    
+    def archivePunchcards(self, months = 2, today = None):
+        """Move used-up cards ('prev') whose last punch is more than `months` months old out of punchcards.csv and into
+        the yearly history files. Cards in the old single punchcards_history.csv are moved into the yearly files too.
+        Returns the number of cards archived from punchcards.csv."""
+        
+        if today is None:
+            today = datetime.today()
+        cutoff = int((today - timedelta(days=int(months * 30.5))).strftime('%Y%m%d'))
+        
+        # split up the old single history file the first time through
+        legacyFilepath = os.path.join(self.path, "punchcards_history.csv")
+        if self.database is None and os.path.exists(legacyFilepath):
+            legacyRows = self._readPunchcardFile(legacyFilepath)
+            self._appendToHistory(legacyRows)
+            os.replace(legacyFilepath, legacyFilepath + ".migrated")
+            print(f"INFO 641: Moved {len(legacyRows)} cards from punchcards_history.csv into the yearly history files")
+        
+        keep = []
+        cold = []
+        for rowidx, row in enumerate(self.punchcards):
+            lastPunch = max(row.dates)
+            if row[self.P_STATUS] == "prev" and 0 < lastPunch < cutoff:
+                cold.append(rowidx)
+            else:
+                keep.append(rowidx)
+        if len(cold) == 0:
+            return 0
+        
+        # sqlite backend: the cards just get marked with their history partition, and row order is kept
+        if self.database is not None:
+            self.database.archivePunchcards([self.cardIDs[rowidx] for rowidx in cold],
+                                            {self.cardIDs[rowidx]: f"punchcards_history_{self._historyYear(self.punchcards[rowidx])}.csv" for rowidx in cold})
+            self.cardIDs = [self.cardIDs[rowidx] for rowidx in keep]
+            self.punchcards = [self.punchcards[rowidx] for rowidx in keep]
+            self._buildIndexes()
+            if hasattr(self, "historyDateIndex"):
+                del self.historyDateIndex
+            self.printValidationReport(self.validatePunchcards(sort=False))
+            self.journal.flush()
+            print(f"INFO 642: Archived {len(cold)} punchcards last used before {cutoff}")
+            return len(cold)
+        
+        cold = [self.punchcards[rowidx] for rowidx in cold]
+        keep = [self.punchcards[rowidx] for rowidx in keep]
+        # the history is written first, so a crash part way through can only leave a card in both files (never in neither)
+        self._appendToHistory(cold)
+        self.punchcards = keep
+        self._buildIndexes()
+        if hasattr(self, "historyDateIndex"):
+            del self.historyDateIndex
+        self.printValidationReport(self.validatePunchcards())
+        self._writePunchcards()
+        if self.journal is not None:
+            self.journal.reset()
+        print(f"INFO 642: Archived {len(cold)} punchcards last used before {cutoff}")
+        return len(cold)
+
+    #-------------------------------------------------------------------------------    
+    def _readPunchcardFile(self, filepath):
+        
+        snapshot = CSnapshot(os.path.basename(filepath))
+        punchcardList = snapshot.load()
+        if punchcardList is not None:
+            return punchcardList
+        
+        punchcardList = []
+        countFileLoad(os.path.basename(filepath))
+        with open(filepath, newline='') as csvfile:
+            rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
+            next(rows)
+            for row in rows:
+                if len(row) > 0:
+                    if row[self.P_STATUS] not in VALID_STATUSES:
+                        print("ERROR 636: Card status must be 'curr', 'next', or 'prev' or 'pastdue' (not '" + row[self.P_STATUS] + "')")
+                        print(row)                      
+                    punchcardList.append(CPunchcardRecord.fromRow(row))
+        snapshot.save(punchcardList)
         return punchcardList
     
     #-------------------------------------------------------------------------------    
     def _savePunchcards(self):
 
-        self.validatePunchcards() 
+        # inside a CUnitOfWork session: keep the card statuses right for the rest of the session, but write nothing yet
+        if self.deferSave:
+            self.printValidationReport(self.validatePunchcards(sort=False))
+            return
+
+        # journal mode: the rows are not re-sorted (journal records refer to row numbers), only the changes are appended
+        if self.journal is not None:
+            self.printValidationReport(self.validatePunchcards(sort=False))
+            self.journal.flush()
+            if self.journal.count >= (self.info.getValue("journal_compact_after") or 500):
+                self.compactJournal()
+            else:
+                self.liability.save(sourceSignature(self.path))
+            return
+
+        self.printValidationReport(self.validatePunchcards())
+        self._writePunchcards()
+        return   
+
+    #-------------------------------------------------------------------------------    
+    def _writePunchcards(self):
         filepath = os.path.join(self.path, "punchcards.csv")
-        with open(filepath, 'w', newline='') as csvfile:
+        with open(filepath + ".tmp", 'w', newline='') as csvfile:
             writer = csv.writer(csvfile, delimiter='\t', quotechar='"', quoting=csv.QUOTE_MINIMAL)
             writer.writerow(self.punchcardFileHeader)
             writer.writerows(self.punchcards)      
+        replaceFileAtomic(filepath + ".tmp", filepath)
+        CSnapshot("punchcards.csv").save(self.punchcards)
+        self.liability.save(sourceSignature(self.path))
         return   
+
+    #-------------------------------------------------------------------------------    
+    def checkpoint(self):
+        """In journal mode, make the changes so far durable without a full save. Otherwise does nothing."""
+        if self.journal is not None and not self.deferSave:
+            self.journal.flush()
+
+    #-------------------------------------------------------------------------------    
+    def compactJournal(self):
+        """Fold the journal back into punchcards.csv (validated and sorted) and start a new journal"""
+        if self.journal is None or self.database is not None:
+            return
+        self.printValidationReport(self.validatePunchcards())
+        self._writePunchcards()
+        self.journal.reset()
     
     def createEmptyRow(self):
-        return [''] * len(self.punchcardFileHeader)
+        return CPunchcardRecord()
             
     #-------------------------------------------------------------------------------    
     def alreadyProcessed(self, date):
@@ -99,12 +496,59 @@ class CPunchcards:
             return False
         
         # check if any punchcard has already been charged for this date
-        for row in self.punchcards:
-            for slot in range(self.totalSlotCount):
-                slotVal = row[self.slotIdx(slot)]
-                if not slotVal is None and slotVal == date:
-                    return True
-        return False            
+        return len(self.dateIndex.get(date, [])) > 0
+
+    #-------------------------------------------------------------------------------    
+    def _buildHistoryDateIndex(self, startdate = '', enddate = ''):
+        """Load the history cards played between startdate and enddate and index them by play date (done on the first
+        history query, and again if a later one needs a wider date range)"""
+        self.historyPunchcards = self._loadHistory(startdate, enddate)
+        self.historyDateRange = (startdate, enddate)
+        self.historyDateIndex = {}
+        for rowidx,row in enumerate(self.historyPunchcards):
+            for slot, code in enumerate(row.dates):
+                if code != DATE_EMPTY and code != DATE_NULL:
+                    self.historyDateIndex.setdefault(row[self.slotIdx(slot)], []).append((rowidx, slot))
+
+    #-------------------------------------------------------------------------------    
+    def _loadHistoryDateIndex(self, startdate = '', enddate = ''):
+        """Make sure the history date index covers startdate to enddate (empty = no limit)"""
+        if hasattr(self, "historyDateIndex"):
+            low, high = self.historyDateRange
+            if (len(low) == 0 or low <= startdate) and (len(high) == 0 or (len(enddate) > 0 and enddate <= high)):
+                return
+        self._buildHistoryDateIndex(startdate, enddate)
+
+    #-------------------------------------------------------------------------------    
+    def getPunchesOnDate(self, date, includeHistory = False):
+        """Return a list of (punchcard row, slot) for every punch made on the given date (YYYYMMDD)"""
+        punches = [(self.punchcards[rowidx], slot) for rowidx, slot in self.dateIndex.get(date, [])]
+        if includeHistory:
+            self._loadHistoryDateIndex(date, date)
+            punches += [(self.historyPunchcards[rowidx], slot) for rowidx, slot in self.historyDateIndex.get(date, [])]
+        return punches
+
+    #-------------------------------------------------------------------------------    
+    def getPlayDates(self, includeHistory = False, startdate = '', enddate = ''):
+        """Return a sorted list of every date between startdate and enddate (empty = no limit) on which at least one
+        punch was made"""
+        dates = set(date for date in self.dateIndex if len(self.dateIndex[date]) > 0)
+        if includeHistory:
+            self._loadHistoryDateIndex(startdate, enddate)
+            dates.update(self.historyDateIndex)
+        return sorted(date for date in dates if (len(startdate) == 0 or date >= startdate) and
+                                                (len(enddate) == 0 or date <= enddate))
+
+    #-------------------------------------------------------------------------------    
+    def printAttendanceByDate(self, startdate, enddate, includeHistory = True):
+        
+        print(f"\nPunches used between {startdate} and {enddate}")
+        print("----------------------------------------------")
+        for date in self.getPlayDates(includeHistory, startdate, enddate):
+            punches = self.getPunchesOnDate(date, includeHistory)
+            print(date, len(punches), ', '.join(sorted(row[self.P_MEETUPNAME] for row, slot in punches)))
+        print("")
+        return
     
     #-------------------------------------------------------------------------------    
     def printPunchcards(self, player='', status=''):
@@ -120,16 +564,14 @@ class CPunchcards:
     #-------------------------------------------------------------------------------    
     def getPunchcards(self, player='', status=''):
 
-        retList = []        
-        for row in self.punchcards:
-            requested = True
-            if len(player) > 0 and row[self.P_HOCKEYUSERID] != player:
-                requested = False
-            if len(status) > 0 and row[self.P_STATUS] != status:
-                requested = False
-            if requested:
-                retList.append(row)                
-        return retList
+        if len(player) > 0:
+            statuses = [status] if len(status) > 0 else list(self.statusIndex)
+            rowidxs = sorted(rowidx for s in statuses for rowidx in self.playerIndex.get((player, s), []))
+        elif len(status) > 0:
+            rowidxs = sorted(self.statusIndex.get(status, set()))
+        else:
+            rowidxs = range(len(self.punchcards))
+        return [self.punchcards[rowidx] for rowidx in rowidxs]
 
     #-------------------------------------------------------------------------------    
     def slotIdx(self, idx):
@@ -145,20 +587,10 @@ class CPunchcards:
         if pcRow is None:
             return 0, 0, 0
             
-        punches_used = 0
-        remaining_slots = 0
-        null_slots = 0
-        
         # Count all slots: punches used, remaining (empty), and null slots
-        for slot_num in range(1, self.totalSlotCount + 1):
-            if slot_num in self.PLAY_DATE_INDICES:
-                slot_value = pcRow[self.PLAY_DATE_INDICES[slot_num]]
-                if slot_value == 'NULL':
-                    null_slots += 1
-                elif slot_value:  # Has a date
-                    punches_used += 1
-                else:  # Empty/unused
-                    remaining_slots += 1
+        null_slots = pcRow.dates.count(DATE_NULL)
+        remaining_slots = pcRow.dates.count(DATE_EMPTY)
+        punches_used = self.totalSlotCount - null_slots - remaining_slots
         
         # Total usable slots = total - null slots
         total_slots = self.totalSlotCount - null_slots
@@ -175,14 +607,14 @@ class CPunchcards:
             return -1
         
         # find punchcard for this player
-        for rowidx,row in enumerate(self.punchcards):
-            if row[self.P_HOCKEYUSERID] == player and row[self.P_STATUS] == "curr":
-                return rowidx, 0
+        rowidxs = self.playerIndex.get((player, "curr"))
+        if rowidxs:
+            return rowidxs[0], 0
             
         #find punchcard where this player is listed as an alternate
-        for rowidx,row in enumerate(self.punchcards):
-            if row[self.P_ALTPAYERID] == player and row[self.P_STATUS] == "curr":
-                return rowidx, 1         
+        rowidxs = self.altIndex.get((player, "curr"))
+        if rowidxs:
+            return rowidxs[0], 1         
 
         # slot not found
         return -1, 0
@@ -194,9 +626,9 @@ class CPunchcards:
             print ("ERROR 429: getPastDueCard called with invalid player (" +player+ ")")
             return -1
         
-        for rowidx,row in enumerate(self.punchcards):
-            if row[self.P_HOCKEYUSERID] == player and row[self.P_STATUS] == "pastdue":
-                return rowidx
+        rowidxs = self.playerIndex.get((player, "pastdue"))
+        if rowidxs:
+            return rowidxs[0]
 
         # slot not found
         return -1
@@ -212,7 +644,7 @@ class CPunchcards:
         # if no past due card found, add it
         if pcIdx == -1:
             # add past due card for this player
-            roster = CRoster.CRoster()
+            roster = self._getRoster()
             meetupName = roster.getMeetupName(player)
             if len(meetupName) == 0:
                 print("ERROR 530: The following player is not yet in our Roster. No tracking of past due play.")
@@ -224,7 +656,7 @@ class CPunchcards:
             newrow[self.P_STATUS] = "pastdue"
             # New cards (including past due) are 10-punch cards with NULL value in PlayDate11 slot
             newrow[self.PLAY_DATE_INDICES[11]] = 'NULL'  # Put NULL in PlayDate11 slot
-            self.punchcards.append(newrow)
+            self._appendPunchcard(newrow)
             
         # get player's past due card, which should always exist at this point.  (If not, it would have been added above.)
         pcIdx = self.getPastDueCard(player)
@@ -235,7 +667,7 @@ class CPunchcards:
         # find the first unused slot on the past due punchcard
         row = self.punchcards[pcIdx]                
         for slot in range(self.totalSlotCount):
-            if len(row[self.slotIdx(slot)]) == 0:
+            if row.dates[slot] == DATE_EMPTY:
                 return pcIdx, slot
 
         # no past due slot found
@@ -258,7 +690,7 @@ class CPunchcards:
         _, _, total_slots = self.countPunchcardSlots(row)
         
         for slot in range(total_slots):
-            if len(row[self.slotIdx(slot)]) == 0:
+            if row.dates[slot] == DATE_EMPTY:
                 return pcIdx, slot, isAlt
 
         # no payment slot found
@@ -275,23 +707,30 @@ class CPunchcards:
             print ("ERROR 237: makePayment called with invalid punchcardIdx (" +pcIdx+ ") or slot number (" +str(slot)+ ")")
             return False
         
+        oldDate = self.punchcards[pcIdx][self.slotIdx(slot)]
+        if oldDate in self.dateIndex and (pcIdx, slot) in self.dateIndex[oldDate]:
+            self.dateIndex[oldDate].remove((pcIdx, slot))
         self.punchcards[pcIdx][self.slotIdx(slot)] = date
+        if len(oldDate) == 0:
+            self.liability.adjust(pcIdx, -1)      # a prepaid punch was used
+        self.dateIndex.setdefault(date, []).append((pcIdx, slot))
+        self._touch(self.punchcards[pcIdx].hockeyID)
+        self._journal({"op": "punch", "row": pcIdx, "slot": slot, "date": date})
         # Check if any punches remain after this punch
         # If no punches remain, change status to "prev"
         _, remaining_slots, _ = self.countPunchcardSlots(self.punchcards[pcIdx])
         if remaining_slots == 0 and self.punchcards[pcIdx][self.P_STATUS] == "curr":
-            self.punchcards[pcIdx][self.P_STATUS] = "prev"
+            self._setStatus(pcIdx, "prev")
         return True
     
     #-------------------------------------------------------------------------------    
     def getPunchcardCount(self, player=''):
         
-        count = 0
-        for rowidx,row in enumerate(self.punchcards):
-            if ((player == row[self.P_HOCKEYUSERID] or player == row[self.P_ALTPAYERID]) and 
-                (row[self.P_STATUS] == "curr" or row[self.P_STATUS] == "next")):
-                count += 1
-        return count
+        rowidxs = set()
+        for status in ("curr", "next"):
+            rowidxs.update(self.playerIndex.get((player, status), []))
+            rowidxs.update(self.altIndex.get((player, status), []))
+        return len(rowidxs)
     
     #-------------------------------------------------------------------------------    
     def makePayment(self, player='', date=''):
@@ -311,8 +750,8 @@ class CPunchcards:
     #-------------------------------------------------------------------------------    
     def addPunchcards(self):
         
-        roster = CRoster.CRoster()
-        email = CEmail.CEmail()
+        roster = self._getRoster()
+        email = self.session.email
         
         print()
         print()
@@ -346,8 +785,8 @@ class CPunchcards:
             for ccEmail in ccList:
                 email.sendEmail(ccEmail, "A punchcard has been activated for " + playerMeetupName, body)                
 
-            self.punchcards[pcPastDueIdx][self.P_STATUS] = 'curr'
-            self.punchcards[pcPastDueIdx][self.P_PURCHASEDATE] = currentDate          
+            self._setStatus(pcPastDueIdx, 'curr')
+            self._setField(pcPastDueIdx, self.P_PURCHASEDATE, currentDate)
 
         # otherwise, do a normal addition of newly purchased punchcard
         else:
@@ -366,155 +805,243 @@ class CPunchcards:
             newPunchcard[self.P_STATUS] = "curr"
             newPunchcard[self.P_PURCHASEDATE] = currentDate
             newPunchcard[self.PLAY_DATE_INDICES[11]] = 'NULL'  # Put NULL in PlayDate11 slot
-            self.punchcards.append(newPunchcard)            
+            self._appendPunchcard(newPunchcard)            
         return
     
     #-------------------------------------------------------------------------------    
-    def validatePunchcards(self):
+    def refundPunchcard(self):
+        
+        roster = self._getRoster()
+        
+        print()
+        print()
+        print("Punchcard Refund")
+        
+        playerRecord = roster.getPlayerName()
+        if playerRecord is None:
+            print("exiting Punchcard Refund ...")
+            return
+        
+        playerHockeyID = playerRecord[roster.R_HOCKEYUSERID]
+        cards = self.playerIndex.get((playerHockeyID, "curr"), []) + self.playerIndex.get((playerHockeyID, "next"), [])
+        if len(cards) == 0:
+            print("No current or next punchcard to refund.")
+            return
+        
+        price = self.liability.price()
+        for index, pcIdx in enumerate(cards, 1):
+            remaining = self.liability.cards[pcIdx][3]
+            print(f"Choice {index}: {self.punchcards[pcIdx][self.P_STATUS]} card purchased {self.punchcards[pcIdx][self.P_PURCHASEDATE]}, {remaining} punches left (${remaining * price:.2f})")
+        choice = input("Which punchcard would you like to refund? ")
+        try:
+            choice_val = int(choice)
+        except ValueError:
+            print("Nothing done")
+            return
+        if not 1 <= choice_val <= len(cards):
+            print("Nothing done")
+            return
+        
+        pcIdx = cards[choice_val - 1]
+        remaining = self.liability.cards[pcIdx][3]
+        if input(f"Refund ${remaining * price:.2f} for {remaining} unused punches to {playerRecord[roster.R_MEETUPNAME]}? (y/n) ").strip().upper() == "Y":
+            self._setStatus(pcIdx, "REFUNDED")
+            print(f"Punchcard marked REFUNDED. The club's prepaid liability is now {self.liability.total} punches (${self.liability.total * price:.2f})")
+        else:
+            print("Nothing done")
+        return
+    
+    #-------------------------------------------------------------------------------    
+    def validatePunchcards(self, sort=True, roster=None):
+        """Check the punchcards of every player changed since the last validation (all players the first time).
+        
+        One pass over the cards, grouped by player, against a single roster. Fixes what it can (missing Meetup name,
+        curr/next/prev statuses) and returns a list of problems it can't fix, as (Hockey User ID, message) tuples.
+        """
+        if sort:
+            self.punchcards = sorted(self.punchcards, key=lambda x: x[self.P_MEETUPNAME].upper())
+            self._buildIndexes()
+        if roster is None:
+            roster = self._getRoster()
+
+        # group the cards to check by player, in file order
+        cardsByPlayer = {}
+        if self.touchedPlayers is None:
+            for rowidx,row in enumerate(self.punchcards):
+                cardsByPlayer.setdefault(row.hockeyID, []).append(rowidx)
+        else:
+            for player in self.touchedPlayers:
+                cardsByPlayer[player] = sorted(rowidx for status in self.statusIndex 
+                                               for rowidx in self.playerIndex.get((player, status), []))
 
-        self.punchcards = sorted(self.punchcards, key=lambda x: x[self.P_MEETUPNAME].upper())
-        playerList = list(set(row[self.P_HOCKEYUSERID] for row in self.punchcards))
-        for player in playerList:
-            self.validatePlayer(player)
+        report = []
+        for player, rowidxs in cardsByPlayer.items():
+            report += self._validateCards(player, rowidxs, roster)
+        self.touchedPlayers = set()
+        return report
 
     #-------------------------------------------------------------------------------    
-    def validatePlayer(self, player=''):
+    def validatePlayer(self, player='', roster=None):
         
-        roster = CRoster.CRoster()
+        if roster is None:
+            roster = self._getRoster()
+        rowidxs = sorted(rowidx for status in self.statusIndex for rowidx in self.playerIndex.get((player, status), []))
+        return self._validateCards(player, rowidxs, roster)
+
+    #-------------------------------------------------------------------------------    
+    def _validateCards(self, player, rowidxs, roster):
         
+        report = []
         currCount = 0
         meetupName = roster.getMeetupName(player)
         if len(meetupName) == 0:
-            print("ERROR - Invalid Hockey ID =", player)
-            print("ERROR - Invalid Hockey ID =", player)
-            print("ERROR - Invalid Hockey ID =", player)   
-            val = 'a'
-            while val.upper() != "X":
-                val = input("Press X to continue")
-
-        for rowidx,row in enumerate(self.punchcards):
-            
-            # punchcard for this player
-            if row[self.P_HOCKEYUSERID] == player:
-                
-                # check if meetup name is missing
-                if len(row[self.P_MEETUPNAME]) == 0:
-                    row[self.P_MEETUPNAME] = meetupName
+            report.append((player, "ERROR - Invalid Hockey ID (not in roster.csv)"))
+
+        for rowidx in rowidxs:
+            row = self.punchcards[rowidx]
                 
-                # check if any money left on this card
-                emptySlotFound = False
-                if row[self.P_STATUS] == "curr" or row[self.P_STATUS] == "next":               
-                    for idx in range(self.totalSlotCount):
-                        if len(row[self.slotIdx(idx)]) == 0:
-                            emptySlotFound = True
-                    if not emptySlotFound:
-                        row[self.P_STATUS] = "prev"
+            # check if meetup name is missing
+            if len(row[self.P_MEETUPNAME]) == 0:
+                self._setField(rowidx, self.P_MEETUPNAME, meetupName)
+            
+            # check if any money left on this card
+            if row[self.P_STATUS] == "curr" or row[self.P_STATUS] == "next":               
+                emptySlotFound = DATE_EMPTY in row.dates
+                if not emptySlotFound:
+                    self._setStatus(rowidx, "prev")
+                else:
+                    if currCount == 0:
+                        self._setStatus(rowidx, "curr")
+                        currCount += 1
                     else:
-                        if currCount == 0:
-                            row[self.P_STATUS] = "curr"
-                            currCount += 1
-                        else:
-                            row[self.P_STATUS] = "next"   
+                        self._setStatus(rowidx, "next")   
+        return report
 
-                # check if any money left on this card                            
+    #-------------------------------------------------------------------------------    
+    def printValidationReport(self, report):
+        for player, message in report:
+            print(message, "=", player)
     
     #-------------------------------------------------------------------------------    
-    def manualPunch(self, punchDate, gameStars = 20):       # gameStars: 20=full punch, 10=half punch
+    def _getRoster(self):
+        """The session's roster, loaded once and shared with CGameDay/CEmail"""
+        if self.roster is None:
+            self.roster = self.session.roster
+        return self.roster
+
+    #-------------------------------------------------------------------------------    
+    def manualPunch(self, punchDate, gameStars = 20, players = None):       # gameStars: 20=full punch, 10=half punch
+        """Punch players one at a time. Pass players (a list of Hockey User IDs) to punch them without prompting.
+        
+        The whole session is one CUnitOfWork: punchcards.csv and roster.csv are written once, when it ends, and the
+        punch emails are held until then, so a crash part way through never leaves an email for an unsaved punch.
+        """
         
-        email = CEmail.CEmail()
-        roster = CRoster.CRoster()  
+        email = self.session.email
+        roster = self._getRoster()      # validate against the same roster the session is changing
 
         if gameStars == 20:
             print("\n\nManual Punch")
         else:
             print("\n\nManual HALF of a Punch")
         
-        while True:
+        playerIDs = iter(players or [])
+        with CUnitOfWork(self, roster, email):
+            while True:
 
-            playerRecord = roster.getPlayerName()
-            if playerRecord is None:
-                print("exiting Manual Punch ...")
-                return False
-            
-            playerMeetupName = playerRecord[roster.R_MEETUPNAME]
-            playerHockeyID = playerRecord[roster.R_HOCKEYUSERID]
-            playerEmail = playerRecord[roster.R_EMAIL]     
-
-            starcount = 0
-            bEarlyBird = False
-            gamePaid = False
-
-            # check if can pay for game using stars
-            if self.useStars:        
-                starcount = roster.getStars(playerHockeyID)
-                if starcount is None:
-                    starcount = 0
-                    print("\nERROR reading starcount in CPunchcards for ", playerMeetupName)
-                if starcount >= gameStars:
-                    emailAddress = roster.getEmail(playerHockeyID) 
-                    meetupName = roster.getMeetupName(playerHockeyID)
-                    if gameStars == 20:
-                        subject, body = email.composeUseStarsForFreeGameEmail(playerHockeyID, meetupName, punchDate)
-                    else:
-                        subject, body = email.composeUseStarsForFreeHalfGameEmail(playerHockeyID, meetupName, punchDate)
-                    email.sendEmail(emailAddress, subject, body)
-                    starcount -= gameStars
-                    roster.setStars(playerHockeyID, starcount)
-                    gamePaid = True
-
-            # use a punch on their punchcard (they didn't have enough stars yet)                
-            if not gamePaid:        
-                pcIdx,slot,isAlt = self.getNextFreePaymentSlot(player=playerHockeyID)
-                paid = False
-                if slot >= 0:
-                    # Calculate remaining punches using utility function
-                    punches_used, remaining_slots, total_slots = self.countPunchcardSlots(self.punchcards[pcIdx])
-                    remainingPunches = remaining_slots
-                    print(f"{playerHockeyID} {playerMeetupName} >>> Payment {slot+1} ({remainingPunches} left on this card)")
-                    paid = self.makePayment(player=playerHockeyID, date=punchDate)
-                    # when only charging a half-game (10 stars), charge them a punch then give them 10 stars so only charging them half a game
-                    if gameStars != 20:
-                        starcount = roster.getStars(playerHockeyID)
-                        if starcount is None:
-                            starcount = 0
-                            print("\nERROR2 reading starcount in CPunchcards for ", playerMeetupName)
-                        starcount += 20 - gameStars
-                        roster.setStars(playerHockeyID, starcount)
-                if paid:
-                    subject, body = email.composeUsePunchcardEmail(playerHockeyID, playerMeetupName, punchDate, self.punchcards[pcIdx], slot, False, starcount, gameStars)
-                    email.sendEmail(playerEmail, subject, body)   
-                    ccList = self.info.getValue("cc_punchused") 
-                    for ccEmail in ccList:
-                        email.sendEmail(ccEmail, f"A manual punch-used email was sent to {playerEmail}", body)
-                    print(f"{playerHockeyID} {playerMeetupName} >>> email confirmation sent\n")
+                if players is None:
+                    playerRecord = roster.getPlayerName()
                 else:
-                    pcIdx,slot = self.getNextFreePastDueSlot(player=playerHockeyID)
-                    if pcIdx >= 0 and slot >= 0:
-                        paid = self.makePaymentBySlot(pcIdx, slot, punchDate)
-                        print(f"{playerHockeyID} {playerMeetupName} >>> added to past due account")
+                    playerRecord = None
+                    for hockeyID in playerIDs:
+                        playerRecord = roster.roster.get(hockeyID)
+                        if playerRecord is not None:
+                            break
+                        print("ERROR 533: No player with Hockey ID", hockeyID, "in our Roster. Nothing done.")
+                if playerRecord is None:
+                    print("exiting Manual Punch ...")
+                    break
+
+                self._manualPunchPlayer(playerRecord, punchDate, gameStars, roster, email)
+                # only validates while the session is open (e.g. moves a filled card's player onto their next card)
+                self._savePunchcards() 
+        return False
+
+    #-------------------------------------------------------------------------------    
+    def _manualPunchPlayer(self, playerRecord, punchDate, gameStars, roster, email):
+
+        playerMeetupName = playerRecord[roster.R_MEETUPNAME]
+        playerHockeyID = playerRecord[roster.R_HOCKEYUSERID]
+        playerEmail = playerRecord[roster.R_EMAIL]     
+
+        starcount = 0
+        bEarlyBird = False
+        gamePaid = False
+
+        # check if can pay for game using stars
+        if self.useStars:        
+            starcount = roster.getStars(playerHockeyID)
+            if starcount is None:
+                starcount = 0
+                print("\nERROR reading starcount in CPunchcards for ", playerMeetupName)
+            if starcount >= gameStars:
+                emailAddress = roster.getEmail(playerHockeyID) 
+                meetupName = roster.getMeetupName(playerHockeyID)
+                if gameStars == 20:
+                    subject, body = email.composeUseStarsForFreeGameEmail(playerHockeyID, meetupName, punchDate)
+                else:
+                    subject, body = email.composeUseStarsForFreeHalfGameEmail(playerHockeyID, meetupName, punchDate)
+                email.sendEmail(emailAddress, subject, body)
+                starcount -= gameStars
+                roster.spendStars(playerHockeyID, gameStars, punchDate, "free game" if gameStars == 20 else "free half game")
+                gamePaid = True
+
+        # use a punch on their punchcard (they didn't have enough stars yet)                
+        if not gamePaid:        
+            pcIdx,slot,isAlt = self.getNextFreePaymentSlot(player=playerHockeyID)
+            paid = False
+            if slot >= 0:
+                # Calculate remaining punches using utility function
+                punches_used, remaining_slots, total_slots = self.countPunchcardSlots(self.punchcards[pcIdx])
+                remainingPunches = remaining_slots
+                print(f"{playerHockeyID} {playerMeetupName} >>> Payment {slot+1} ({remainingPunches} left on this card)")
+                paid = self.makePayment(player=playerHockeyID, date=punchDate)
+                # when only charging a half-game (10 stars), charge them a punch then give them 10 stars so only charging them half a game
+                if gameStars != 20:
+                    starcount = roster.getStars(playerHockeyID)
+                    unreadable = starcount is None
+                    if unreadable:
+                        starcount = 0
+                        print("\nERROR2 reading starcount in CPunchcards for ", playerMeetupName)
+                    starcount += 20 - gameStars
+                    # counts that can't be read can't be added to, so they're set to the new value instead
+                    if unreadable or roster.creditStars(playerHockeyID, 20 - gameStars, punchDate, "half game charged a full punch") is None:
+                        roster.setStars(playerHockeyID, starcount, punchDate, "half game charged a full punch (star count was unreadable)")
+            if paid:
+                subject, body = email.composeUsePunchcardEmail(playerHockeyID, playerMeetupName, punchDate, self.punchcards[pcIdx], slot, False, starcount, gameStars)
+                email.sendEmail(playerEmail, subject, body)   
+                ccList = self.info.getValue("cc_punchused") 
+                for ccEmail in ccList:
+                    email.sendEmail(ccEmail, f"A manual punch-used email was sent to {playerEmail}", body)
+                print(f"{playerHockeyID} {playerMeetupName} >>> email confirmation sent\n")
+            else:
+                pcIdx,slot = self.getNextFreePastDueSlot(player=playerHockeyID)
+                if pcIdx >= 0 and slot >= 0:
+                    paid = self.makePaymentBySlot(pcIdx, slot, punchDate)
+                    print(f"{playerHockeyID} {playerMeetupName} >>> added to past due account")
 
-            self._savePunchcards() 
-            roster.saveRoster()
-    
     #-------------------------------------------------------------------------------    
     def _loadPastDuePunchcards(self):
         
-        self.pastDuePunchcards = []
-        filepath = os.path.join(self.path, "punchcards.csv")
-        with open(filepath, newline='') as csvfile:
-            rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
-            next(rows)
-            for row in rows:
-                if len(row) > 0:
-                    if row[self.P_STATUS] == "pastdue":                    
-                        self.pastDuePunchcards.append(row)
+        # already loaded, so no need to re-read punchcards.csv
+        self.pastDuePunchcards = [self.punchcards[rowidx] for rowidx in sorted(self.statusIndex["pastdue"])]
         return    
     
     #-------------------------------------------------------------------------------    
     def sendPastDueNotices(self):
         
-        roster = CRoster.CRoster()
-        email = CEmail.CEmail()     
+        roster = self._getRoster()
+        email = self.session.email
 
         self._loadPastDuePunchcards()
         for row in self.pastDuePunchcards:
@@ -536,80 +1063,72 @@ class CPunchcards:
                 print("Nothing done")
 
     #-------------------------------------------------------------------------------    
-    def errorCheck(self):
+    def findDuplicateCharges(self, startdate = '', enddate = '', includeHistory = True):
+        """Return [(Hockey User ID, date, [(source, punchcard row, slot), ...]), ...] for everyone charged more than once
+        on the same day, between startdate and enddate (YYYYMMDD, inclusive). See findDuplicateCharges() below."""
+        low = int(startdate) if len(startdate) > 0 else 1
+        high = int(enddate) if len(enddate) > 0 else 99999999
+        sources = [("punchcards.csv", self.punchcards)]
+        if includeHistory:
+            sources.append(("history", self._loadHistory(startdate, enddate)))
+        shared = set(self.info.getValue("shared_punchcards") or [])
+        return findDuplicateCharges(sources, low, high, shared, lambda date: set(self.session.attendance.getAttendees(date)))
+    
+    #-------------------------------------------------------------------------------    
+    def printDuplicateCharges(self, duplicates):
+        for payer, date, occurrences in duplicates:
+            print(f"WARNING 671: {payer} was charged {len(occurrences)} times on {date}")
+            for source, row, slot in occurrences:
+                print(f"             {source}: {row[self.P_STATUS]} card of {row.meetupName} purchased {row.purchaseDate}, punch {slot+1}")
+    
+    #-------------------------------------------------------------------------------    
+    def errorCheck(self, startdate = '', enddate = ''):
         # this routine checks if anyone has been charged multiple punches on the same date.
         # this happened to Mike Sick and Aniket during a period when I was manually entering punches due to a site breakage on Meetup.
         # it occurs naturally sometimes, e.g. Paden/Denise and Brian/daughter and Omri's final half-punchcard
-        
-        filepath = os.path.join(self.path, "punchcards.csv")
-        with open(filepath, newline='') as csvfile:
-            rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
-            for row in rows:
-                prev_row = "!@#$"
-                for i in range(self.totalSlotCount):
-                    if len(row[self.slotIdx(i)]) > 0 and prev_row == row[self.slotIdx(i)]:
-                        print("Duplicate: ", prev_row, row)
-                    prev_row = row[self.slotIdx(i)]                                
-        return
+        # (a card's owner and alt payer both playing isn't reported; add any others to "shared_punchcards" in info.json once they've been checked)
+        duplicates = self.findDuplicateCharges(startdate, enddate)
+        self.printDuplicateCharges(duplicates)
+        return len(duplicates)
     
     #-------------------------------------------------------------------------------
-    # find next available punch for this player
-    # returns punchcardIdx, slot
+    # number of prepaid punches not yet used, from the liability ledger
     def countPrepaymentPunches(self):
-        
-        count = 0
-        for rowidx,row in enumerate(self.punchcards):
-            if row[self.P_STATUS] == "curr" or row[self.P_STATUS] == "next":
-                for slot in range(self.totalSlotCount):
-                    if len(row[self.slotIdx(slot)]) == 0:
-                        count += 1
+        return self.liability.total
 
-        return count
-    
     #-------------------------------------------------------------------------------
-    # count historical punches used for each player in a given period of time
-    def countPunchesUsed(self, historicPunchcards, startdate, enddate):  
-        playerCountDict = {}
-        dates = set()
+    def verifyLiability(self):
+        """Recount the unused prepaid punches card by card and compare them with the liability ledger"""
+        counts = {}
+        for rowidx in self.statusIndex["curr"] | self.statusIndex["next"]:
+            row = self.punchcards[rowidx]
+            counts[row.hockeyID] = counts.get(row.hockeyID, 0) + row.dates.count(DATE_EMPTY)
+        counts = {hockeyID: count for hockeyID, count in counts.items() if count != 0}
         
-        for row in historicPunchcards:
-            
-            playerID   = row[self.P_HOCKEYUSERID]
-            playerName = row[self.P_MEETUPNAME]
-            
-            # find the first unused punch on the punchcard
-            for slot in range(self.totalSlotCount):
-                val = row[self.slotIdx(slot)]
-                if len(val) > 0 and startdate <= val <= enddate:
-                    dates.add(val)
-                    if not playerID in playerCountDict:
-                        playerCountDict[playerID] = {'name': playerName, 'count': 0}                        
-                    playerCountDict[playerID]['count'] += 1
-                    
-        return playerCountDict, len(dates)          
-
-    #-------------------------------------------------------------------------------
-    # count historical punches used for each player in a given period of time
-    def countGamesPlayedInYear(self):          
-        startdate = '20240101'
-        enddate = '20241231'
-        historicPunchcards = self.loadPunchcards(includeHistory=True)
-        playerCountDict, totalGameCount = self.countPunchesUsed(historicPunchcards, startdate, enddate)
-        sortedPlayerCountsDict = dict(sorted(playerCountDict.items(), key=lambda item: item[1]['count'], reverse=True))
-        print(f"\nTotal games played between {startdate} and {enddate} is {totalGameCount}")
-        for x in sortedPlayerCountsDict:
-            print(sortedPlayerCountsDict[x]['name'], sortedPlayerCountsDict[x]['count'])        
-            
+        ok = True
+        for hockeyID in set(counts) | set(self.liability.players):
+            if counts.get(hockeyID, 0) != self.liability.players.get(hockeyID, 0):
+                print("ERROR 661: Liability ledger has", self.liability.players.get(hockeyID, 0), "punches for", hockeyID,
+                      "but the punchcards have", counts.get(hockeyID, 0))
+                ok = False
+        if sum(counts.values()) != self.liability.total:
+            print("ERROR 662: Liability ledger total is", self.liability.total, "but the punchcards have", sum(counts.values()))
+            ok = False
+        if ok:
+            print("INFO 663: Liability ledger matches the punchcards:", self.liability.total, "unused punches")
+        return ok
+    
 #-------------------------------------------------------------------------------           
 if __name__ == "__main__":        
     
     pc = CPunchcards()
     
-    pc.countGamesPlayedInYear()   
+    from CAnalytics import CAnalytics
+    year = datetime.today().year
+    CAnalytics(pc).printReport(f"{year}0101", f"{year}1231")
     
-    x = pc.countPrepaymentPunches()
-    print()
-    print(x, "prepaid, but not yet used, punches.  Total value (at $9.00 each) is   $", x*9)
+    pc.liability.printReport()
+    pc.verifyLiability()
     print()
     
     print("all done")
@@ -0,0 +1,295 @@
+import sys
+from array import array
+
+# Punchcard statuses are stored as small integers. Unknown statuses found in a hand-edited file are appended so they
+# survive a load/save round trip unchanged.
+STATUS_NAMES = ["curr", "next", "prev", "pastdue", "REFUNDED"]
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+
+# Play dates are stored as YYYYMMDD integers. An empty slot is 0 and the 'NULL' marker (unused 11th slot on 10-punch
+# cards) is -1. Anything else that isn't an 8 digit date (a hand-edit typo) is kept verbatim in ODD_DATES and encoded
+# as a negative index into that list.
+DATE_EMPTY = 0
+DATE_NULL = -1
+ODD_DATES = []
+ODD_DATE_CODES = {}
+
+#-------------------------------------------------------------------------------
+def encodeStatus(status):
+    code = STATUS_CODES.get(status)
+    if code is None:
+        code = len(STATUS_NAMES)
+        STATUS_NAMES.append(status)
+        STATUS_CODES[status] = code
+    return code
+
+#-------------------------------------------------------------------------------
+def encodeDate(date):
+    if len(date) == 0:
+        return DATE_EMPTY
+    if date == 'NULL':
+        return DATE_NULL
+    if len(date) == 8 and date.isdigit():
+        return int(date)
+    code = ODD_DATE_CODES.get(date)
+    if code is None:
+        code = -2 - len(ODD_DATES)
+        ODD_DATES.append(date)
+        ODD_DATE_CODES[date] = code
+    return code
+
+#-------------------------------------------------------------------------------
+def decodeDate(code):
+    if code > 0:
+        return str(code)
+    if code == DATE_EMPTY:
+        return ''
+    if code == DATE_NULL:
+        return 'NULL'
+    return ODD_DATES[-2 - code]
+
+# header row of meetup_roster.csv (Meetup User ID -> Hockey User ID cross reference)
+XREF_FILE_HEADER = ["Meetup name", "Meetup User ID", "Hockey User ID"]
+
+#-------------------------------------------------------------------------------
+class CPunchcardRecord:
+    """One row of punchcards.csv (or punchcards_history.csv).
+
+    Indexing with the CPunchcards column numbers (P_STATUS, slotIdx(), ...) reads and writes the same strings as the
+    file, so code written against plain csv rows keeps working. Code on a hot path can use the typed attributes instead.
+    """
+    __slots__ = ("hockeyID", "meetupName", "altID", "altName", "status", "purchaseDate", "dates", "extra")
+
+    FIRST_DATE_COLUMN = 6
+    SLOT_COUNT = 11
+    COLUMN_COUNT = FIRST_DATE_COLUMN + SLOT_COUNT
+    FILE_HEADER = ["Hockey User ID", "Meetup name", "Alt ID", "Alt name", "Status", "PurchaseDate"] + \
+        [f"PlayDate{str(i).zfill(2)}" for i in range(1, SLOT_COUNT + 1)]
+
+    def __init__(self):
+        self.hockeyID = ''
+        self.meetupName = ''
+        self.altID = ''
+        self.altName = ''
+        self.status = encodeStatus('')
+        self.purchaseDate = ''
+        self.dates = array('l', [DATE_EMPTY] * self.SLOT_COUNT)
+        self.extra = ()
+
+    #-------------------------------------------------------------------------------
+    @classmethod
+    def fromRow(cls, row):
+        rec = cls()
+        if len(row) < cls.COLUMN_COUNT:
+            row = row + [''] * (cls.COLUMN_COUNT - len(row))
+        rec.hockeyID = sys.intern(row[0])
+        rec.meetupName = sys.intern(row[1])
+        rec.altID = sys.intern(row[2])
+        rec.altName = sys.intern(row[3])
+        rec.status = encodeStatus(row[4])
+        rec.purchaseDate = sys.intern(row[5])
+        rec.dates = array('l', [encodeDate(val) for val in row[cls.FIRST_DATE_COLUMN:cls.COLUMN_COUNT]])
+        rec.extra = tuple(row[cls.COLUMN_COUNT:])
+        return rec
+
+    #-------------------------------------------------------------------------------
+    def copy(self):
+        rec = CPunchcardRecord.__new__(CPunchcardRecord)
+        for name in self.__slots__:
+            setattr(rec, name, getattr(self, name))
+        rec.dates = array('l', self.dates)
+        return rec
+
+    #-------------------------------------------------------------------------------
+    def __getstate__(self):
+        # compact pickle for CSnapshot: a flat tuple, with the play dates as raw bytes
+        return (self.hockeyID, self.meetupName, self.altID, self.altName, self.status, self.purchaseDate,
+                self.dates.tobytes(), self.extra)
+
+    def __setstate__(self, state):
+        self.hockeyID, self.meetupName, self.altID, self.altName, self.status, self.purchaseDate, dates, self.extra = state
+        self.dates = array('l')
+        self.dates.frombytes(dates)
+
+    #-------------------------------------------------------------------------------
+    def toRow(self):
+        return [self.hockeyID, self.meetupName, self.altID, self.altName, STATUS_NAMES[self.status], self.purchaseDate] + \
+            [decodeDate(code) for code in self.dates] + list(self.extra)
+
+    #-------------------------------------------------------------------------------
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.toRow()[idx]
+        if idx < 0:
+            idx += len(self)
+        if idx >= self.FIRST_DATE_COLUMN:
+            if idx < self.COLUMN_COUNT:
+                return decodeDate(self.dates[idx - self.FIRST_DATE_COLUMN])
+            return self.extra[idx - self.COLUMN_COUNT]
+        if idx == 4:
+            return STATUS_NAMES[self.status]
+        return (self.hockeyID, self.meetupName, self.altID, self.altName, None, self.purchaseDate)[idx]
+
+    #-------------------------------------------------------------------------------
+    def __setitem__(self, idx, value):
+        if idx < 0:
+            idx += len(self)
+        if idx >= self.COLUMN_COUNT:
+            extra = list(self.extra)
+            extra[idx - self.COLUMN_COUNT] = value
+            self.extra = tuple(extra)
+        elif idx >= self.FIRST_DATE_COLUMN:
+            self.dates[idx - self.FIRST_DATE_COLUMN] = encodeDate(value)
+        elif idx == 4:
+            self.status = encodeStatus(value)
+        else:
+            setattr(self, ("hockeyID", "meetupName", "altID", "altName", None, "purchaseDate")[idx], sys.intern(value))
+
+    def __len__(self):
+        return self.COLUMN_COUNT + len(self.extra)
+
+    def __iter__(self):
+        return iter(self.toRow())
+
+    def __repr__(self):
+        return repr(self.toRow())
+
+#-------------------------------------------------------------------------------
+class CRosterRecord:
+    """One row of roster.csv.
+
+    Indexing with the CRoster column numbers (R_MEETUPNAME, R_STARS, ...) reads and writes the same strings as the file.
+    The star balances are kept as integers in .stars and .cumStars; a value that isn't a number in the file is kept as
+    the original string so getStars() can still report it as unreadable. The text a balance was read from (e.g. "07")
+    is kept in .starsText/.cumStarsText and written back as it was until the balance changes.
+    """
+    COLUMNS = ("hockeyID", "meetupName", "first", "last", "email", "address", "isMember", "textPhone", "altPhone",
+               "stars", "cumStars", "useEmail", "useText", "everyCharge", "weekly", "monthly", "whenXleft")
+    FILE_HEADER = ["Hockey User ID", "Meetup name", "First", "Last", "Email", "Address", "isMember", "textPhone",
+                   "altPhone", "StarsCur", "StarsTot", "useEmail", "useText", "everyCharge", "weekly", "monthly", "whenXleft"]
+    INTERNED = {"hockeyID", "meetupName", "first", "last"}
+    STAR_COLUMNS = {"stars", "cumStars"}
+    __slots__ = COLUMNS + ("extra", "starsText", "cumStarsText")
+
+    def __init__(self):
+        for name in self.COLUMNS:
+            setattr(self, name, '')
+        self.extra = ()
+        self.starsText = self.cumStarsText = None       # (balance as read, text it was read from)
+
+    #-------------------------------------------------------------------------------
+    @classmethod
+    def fromRow(cls, row):
+        rec = cls()
+        for idx, val in enumerate(row[:len(cls.COLUMNS)]):
+            rec[idx] = val
+        rec.extra = tuple(row[len(cls.COLUMNS):])
+        return rec
+
+    #-------------------------------------------------------------------------------
+    def copy(self):
+        rec = CRosterRecord.__new__(CRosterRecord)
+        for name in self.__slots__:
+            setattr(rec, name, getattr(self, name))
+        return rec
+
+    #-------------------------------------------------------------------------------
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    #-------------------------------------------------------------------------------
+    def _text(self, name):
+        value = getattr(self, name)
+        if name in self.STAR_COLUMNS:
+            original = getattr(self, name + "Text")
+            if original is not None and original[0] == value:
+                return original[1]
+        return str(value)
+
+    #-------------------------------------------------------------------------------
+    def toRow(self):
+        return [self._text(name) for name in self.COLUMNS] + list(self.extra)
+
+    #-------------------------------------------------------------------------------
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.toRow()[idx]
+        if idx < 0:
+            idx += len(self)
+        if idx >= len(self.COLUMNS):
+            return self.extra[idx - len(self.COLUMNS)]
+        return self._text(self.COLUMNS[idx])
+
+    #-------------------------------------------------------------------------------
+    def __setitem__(self, idx, value):
+        if idx < 0:
+            idx += len(self)
+        if idx >= len(self.COLUMNS):
+            extra = list(self.extra)
+            extra[idx - len(self.COLUMNS)] = value
+            self.extra = tuple(extra)
+            return
+        name = self.COLUMNS[idx]
+        if name in self.STAR_COLUMNS:
+            try:
+                number = int(value)
+            except (TypeError, ValueError):
+                number = value
+            setattr(self, name + "Text", (number, value) if isinstance(value, str) and value != str(number) else None)
+            value = number
+        elif name in self.INTERNED:
+            value = sys.intern(value)
+        setattr(self, name, value)
+
+    def __len__(self):
+        return len(self.COLUMNS) + len(self.extra)
+
+    def __iter__(self):
+        return iter(self.toRow())
+
+    def __repr__(self):
+        return repr(self.toRow())
+
+#-------------------------------------------------------------------------------
+class CAttendeeRecord:
+    """One attendee row of a Meetup game file (games/YYYYMMDD.csv or .xls).
+
+    Indexing with the CGameDay column numbers (M_MEETUPNAME, M_MEETUPUSERID, M_SIGNUPTIME) works as it did on the csv
+    rows, except the signup time is a datetime (None if it couldn't be read) instead of a string.
+    """
+    COLUMNS = ("meetupName", "anonymized", "meetupID", "title", "eventHost", "rsvp", "rsvpedOn")
+    __slots__ = COLUMNS + ("extra",)
+
+    def __init__(self):
+        for name in self.COLUMNS:
+            setattr(self, name, '')
+        self.rsvpedOn = None
+        self.extra = ()
+
+    #-------------------------------------------------------------------------------
+    @classmethod
+    def fromRow(cls, row, rsvpedOn):
+        rec = cls()
+        for name, val in zip(cls.COLUMNS, row):
+            setattr(rec, name, val)
+        rec.rsvpedOn = rsvpedOn
+        rec.extra = tuple(row[len(cls.COLUMNS):])
+        return rec
+
+    #-------------------------------------------------------------------------------
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if idx >= len(self.COLUMNS):
+            return self.extra[idx - len(self.COLUMNS)]
+        return getattr(self, self.COLUMNS[idx])
+
+    def __len__(self):
+        return len(self.COLUMNS) + len(self.extra)
+
+    def __repr__(self):
+        return repr([self[idx] for idx in range(len(self))])
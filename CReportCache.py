@@ -0,0 +1,157 @@
+import os
+import json
+import datetime
+import CPunchcards
+import CSession
+from CLiability import sourceSignature
+from utils import *
+
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+#-------------------------------------------------------------------------------
+class CReportCache:
+    """Per-player/per-month punch counts, saved in report_cache.json. (Prepaid punches are kept by CLiability.)
+
+    Each punchcard file (punchcards.csv and every history file) has its own entry, keyed on the file's size and
+    modification time. The punchcards.csv entry is keyed on punchcards.journal as well (see CLiability.sourceSignature)
+    and summarizes the session's punchcards, so changes still in the journal are counted. Only files that changed since
+    the cache was written are summarized again, so after a gameday just the current punchcards are, and the history
+    files cost one os.stat each.
+
+    Counts are kept by month, plus total punches per play date, so a date range can be answered from the cache when
+    it doesn't cut through the middle of a month's play dates (see canAnswer()).
+    """
+    def __init__(self, session=None):
+        self.path = getHockeyPath()
+        self.cacheFilename = os.path.join(self.path, "report_cache.json")
+        self.session = session if session is not None else CSession.CSession()     # punchcards only loaded if a file has to be re-read
+        self.files = {}
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def _sourceFiles(self):
+        filenames = ["punchcards.csv"]
+        if os.path.exists(os.path.join(self.path, "punchcards_history.csv")):
+            filenames.append("punchcards_history.csv")
+        filenames += CPunchcards.historyPartitions(self.path)
+        return filenames
+
+    #-------------------------------------------------------------------------------
+    def refresh(self):
+        """Bring the cache up to date, re-reading only the files that changed"""
+        cached = {}
+        if os.path.exists(self.cacheFilename):
+            try:
+                with open(self.cacheFilename, 'r') as file:
+                    cached = json.load(file)
+            except ValueError:
+                print("WARNING 651: report_cache.json is unreadable and will be rebuilt")
+
+        self.files = {}
+        changed = False
+        for filename in self._sourceFiles():
+            if filename == "punchcards.csv":
+                signature = sourceSignature(self.path)
+            else:
+                stat = os.stat(os.path.join(self.path, filename))
+                signature = [stat.st_size, stat.st_mtime_ns]
+            entry = cached.get(filename)
+            if entry is None or entry.get("source") != signature:
+                entry = self._summarizeFile(filename)
+                entry["source"] = signature
+                changed = True
+            self.files[filename] = entry
+        if changed or set(cached) != set(self.files):
+            with open(self.cacheFilename + ".tmp", 'w') as file:
+                json.dump(self.files, file)
+            replaceFileAtomic(self.cacheFilename + ".tmp", self.cacheFilename)
+
+    #-------------------------------------------------------------------------------
+    def _summarizeFile(self, filename):
+        punchcards = self.session.punchcards
+        if filename == "punchcards.csv":
+            rows = punchcards.punchcards        # with the journal applied
+        else:
+            rows = punchcards._readPunchcardFile(os.path.join(self.path, filename))
+        players = {}
+        dates = {}
+        for row in rows:
+            player = players.setdefault(row.hockeyID, {"name": row.meetupName, "months": {}})
+            for code in row.dates:
+                if code > 0:
+                    date = str(code)
+                    dates[date] = dates.get(date, 0) + 1
+                    player["months"][date[:6]] = player["months"].get(date[:6], 0) + 1
+        return {"players": players, "dates": dates}
+
+    #-------------------------------------------------------------------------------
+    def _dateTotals(self):
+        totals = {}
+        for entry in self.files.values():
+            for date, count in entry["dates"].items():
+                totals[date] = totals.get(date, 0) + count
+        return totals
+
+    #-------------------------------------------------------------------------------
+    def canAnswer(self, startdate, enddate):
+        """True if every play date in the first and last month of the range falls inside the range"""
+        dates = self._dateTotals()
+        for date in dates:
+            if date[:6] == startdate[:6] and date < startdate:
+                return False
+            if date[:6] == enddate[:6] and date > enddate:
+                return False
+        return True
+
+    #-------------------------------------------------------------------------------
+    def gamesPerPlayer(self, startdate, enddate):
+        """Return {hockeyID: {'name': meetupName, 'count': games}}, most games first"""
+        startMonth, endMonth = startdate[:6], enddate[:6]
+        counts = {}
+        for entry in self.files.values():
+            for hockeyID, player in entry["players"].items():
+                count = sum(n for month, n in player["months"].items() if startMonth <= month <= endMonth)
+                if count > 0:
+                    counts.setdefault(hockeyID, {'name': player["name"], 'count': 0})['count'] += count
+        return dict(sorted(counts.items(), key=lambda item: item[1]['count'], reverse=True))
+
+    #-------------------------------------------------------------------------------
+    def gamesPerMonth(self, startdate, enddate):
+        months = {}
+        for date, count in sorted(self._dateTotals().items()):
+            if startdate <= date <= enddate:
+                months[date[:6]] = months.get(date[:6], 0) + count
+        return months
+
+    #-------------------------------------------------------------------------------
+    def gamesPerWeekday(self, startdate, enddate):
+        weekdays = {name: 0 for name in WEEKDAY_NAMES}
+        for date, count in self._dateTotals().items():
+            if startdate <= date <= enddate:
+                weekdays[WEEKDAY_NAMES[datetime.datetime.strptime(date, "%Y%m%d").weekday()]] += count
+        return weekdays
+
+    #-------------------------------------------------------------------------------
+    def printReport(self, startdate, enddate):
+        dates = [date for date in self._dateTotals() if startdate <= date <= enddate]
+        players = self.gamesPerPlayer(startdate, enddate)
+        print(f"\nTotal games played between {startdate} and {enddate} is {len(dates)}")
+        print(f"{sum(player['count'] for player in players.values())} punches used by {len(players)} players")
+        print("\nGames per player")
+        for player in players.values():
+            print(player['name'], player['count'])
+        print("\nPunches per month")
+        for month, count in self.gamesPerMonth(startdate, enddate).items():
+            print(month, count)
+        print("\nPunches per weekday")
+        for weekday, count in self.gamesPerWeekday(startdate, enddate).items():
+            if count > 0:
+                print(weekday, count)
+        return
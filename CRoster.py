@@ -1,12 +1,22 @@
 import os
 import sys 
 import csv
+from bisect import insort
 from utils import *
 from CInfo import CInfo
+from CRecords import CRosterRecord
+from CJournal import CJournal
+from CSnapshot import CSnapshot
+from CDatabase import CDatabaseLog
+from CPlayerSearch import CPlayerSearch
+from CStarLedger import CStarLedger
+import CAttendance
+
+MAX_PLAYER_CHOICES = 10     # matches listed by getPlayerName() when a name is ambiguous
 
 #-------------------------------------------------------------------------------
 class CRoster:
-    def __init__(self):
+    def __init__(self, info=None, database=None):
         self.R_HOCKEYUSERID = 0        
         self.R_MEETUPNAME = 1        
         self.R_FIRSTNAME = 2
@@ -16,14 +26,25 @@ class CRoster:
         self.R_STARS = 9
         self.R_CUMSTARS = 10
         self.path = getHockeyPath()
-        self.rosterFileHeader = [
-            "Hockey User ID", "Meetup name", "First", "Last", "Email", 
-            "Address", "isMember", "textPhone", "altPhone", "StarsCur", 
-            "StarsTot", "useEmail", "useText", "everyCharge", 
-            "weekly", "monthly", "whenXleft"
-            ]
+        self.rosterFileHeader = list(CRosterRecord.FILE_HEADER)
         self.roster = {}
+        self.info = info if info is not None else CInfo()
+        self.deferSave = False      # set while a CUnitOfWork session is open
+        self.database = database    # hockey.db, if info.json selects the sqlite storage backend
+        self.search = None          # CPlayerSearch, built the first time a player is looked up by name
+        self.modified = False       # anything changed since roster.csv was read or written
+        self.starLedger = CStarLedger(self)
         self._loadRoster()
+        self._buildOrder()
+        
+        # in journal mode, star changes and new players since roster.csv was last written are replayed from roster.journal
+        # (with the sqlite backend they're written straight to hockey.db instead)
+        self.journal = None
+        if self.database is not None:
+            self.journal = CDatabaseLog(self.database.applyRosterChanges)
+        elif self.info.getValue("use_journal"):
+            self.journal = CJournal("roster", "roster.csv")
+            self._replayJournal(self.journal.replay())
 
     def __enter__(self):
         return self
@@ -34,41 +55,111 @@ class CRoster:
 
     #-------------------------------------------------------------------------------    
     def _loadRoster(self):
+        if self.database is not None:
+            self.roster = self.database.loadRoster()
+            return
+        
+        snapshot = CSnapshot("roster.csv")
+        self.roster = snapshot.load()
+        if self.roster is not None:
+            return
+        
         self.roster = {}
         filepath = os.path.join(self.path, "roster.csv")
+        countFileLoad("roster.csv")
         with open(filepath, newline='') as csvfile:
             rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
             next(rows)  # skip header
             for row in rows:
                 if len(row) > 0:           
-                    self.roster[row[self.R_HOCKEYUSERID]] = row
+                    self.roster[row[self.R_HOCKEYUSERID]] = CRosterRecord.fromRow(row)
+        snapshot.save(self.roster)
         return
 
+    #-------------------------------------------------------------------------------    
+    def _sortKey(self, hockeyID):
+        return (self.roster[hockeyID][self.R_MEETUPNAME].upper(), hockeyID)
+
+    #-------------------------------------------------------------------------------    
+    def _buildOrder(self):
+        """roster.csv order (by Meetup name, then Hockey ID), kept up to date as players are added"""
+        self.order = sorted(self._sortKey(hockeyID) for hockeyID in self.roster)
+
+    #-------------------------------------------------------------------------------    
+    def _replayJournal(self, records):
+        for record in records:
+            if record["op"] == "stars" and record["id"] in self.roster:
+                self.roster[record["id"]].stars = record["stars"]
+                self.roster[record["id"]].cumStars = record["cumStars"]
+            elif record["op"] == "player":
+                hockeyID = record["fields"][self.R_HOCKEYUSERID]
+                if hockeyID not in self.roster:
+                    self.roster[hockeyID] = CRosterRecord.fromRow(record["fields"])
+                    insort(self.order, self._sortKey(hockeyID))
+            else:
+                print("ERROR 714: Unknown roster journal record", record)
+
+    #-------------------------------------------------------------------------------    
+    def _journalStars(self, hockeyID):
+        self.modified = True
+        if self.journal is not None:
+            player = self.roster[hockeyID]
+            self.journal.append({"op": "stars", "id": hockeyID, "stars": player.stars, "cumStars": player.cumStars})
+
+    #-------------------------------------------------------------------------------    
+    def checkpoint(self):
+        """In journal mode, make the changes so far durable without a full save. Otherwise does nothing."""
+        if self.journal is not None and not self.deferSave:
+            self.starLedger.flush()
+            self.journal.flush()
+
+    #-------------------------------------------------------------------------------    
+    def compactJournal(self):
+        """Fold the journal back into roster.csv and start a new journal"""
+        if self.journal is None or self.database is not None:
+            return
+        self._writeRoster()
+        self.journal.reset()
+
     #-------------------------------------------------------------------------------    
     def saveRoster(self):
-        player_list = list(set(self.roster.keys()))
-        meetup_name_list = [self.roster[player][self.R_MEETUPNAME].upper() for player in player_list]
-        sort_index = sorted(range(len(meetup_name_list)), key=meetup_name_list.__getitem__)
+        # inside a CUnitOfWork session the write is held until the session commits
+        if self.deferSave:
+            return
+        self.starLedger.flush()
+        # journal mode: only the changes are appended
+        if self.journal is not None:
+            self.journal.flush()
+            if self.journal.count >= (self.info.getValue("journal_compact_after") or 500):
+                self.compactJournal()
+            return
+        if self.modified:
+            self._writeRoster()
 
+    #-------------------------------------------------------------------------------    
+    def _writeRoster(self):
+        # self.order is kept sorted as players are added, so there's nothing to sort here
         filepath = os.path.join(self.path, "roster.csv")
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
+        with open(filepath + ".tmp", 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile, delimiter='\t', quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
             writer.writerow(self.rosterFileHeader)
-            for idx in sort_index:
-                writer.writerow(self.roster[player_list[idx]])
+            writer.writerows(self.roster[hockeyID] for _, hockeyID in self.order)
+        replaceFileAtomic(filepath + ".tmp", filepath)
+        self.modified = False
+        # in file order, the same as the next _loadRoster() would give
+        CSnapshot("roster.csv").save({hockeyID: self.roster[hockeyID] for _, hockeyID in self.order})
         return
 
     #-------------------------------------------------------------------------------    
     def createEmptyRow(self):
-        return [''] * len(self.rosterFileHeader)
+        return CRosterRecord()
 
     #-------------------------------------------------------------------------------    
     def addNewPlayer(self, hockeyID, meetupName, firstName, lastName, email, address, isMember, phone):
         
         if hockeyID in self.roster:
-            info = CInfo()
             print("ERROR 986: Trying to add player who is already in the roster. Contact ", 
-                  info.getValue("admin_contact_info"), hockeyID, meetupName)
+                  self.info.getValue("admin_contact_info"), hockeyID, meetupName)
             sys.exit(93)
         
         if len(address) > 0:
@@ -83,27 +174,37 @@ class CRoster:
         newrow[self.R_LASTNAME] = lastName
         newrow[self.R_EMAIL] = email
         newrow[self.R_PHONE] = phone    
-        newrow[self.R_STARS] = '0'    
-        newrow[self.R_CUMSTARS] = '0'            
+        newrow.stars = 0
+        newrow.cumStars = 0
         self.roster[hockeyID] = newrow
+        insort(self.order, self._sortKey(hockeyID))
+        self.modified = True
+        if self.search is not None:
+            self.search.add(newrow)
+        if self.journal is not None:
+            self.journal.append({"op": "player", "fields": newrow.toRow()})
         self.saveRoster()
         
     #-------------------------------------------------------------------------------    
     def getStars(self, hockeyID):
-        retval = 0
-        try:           
-            retval = int(self.roster[hockeyID][self.R_STARS])
-        except:
+        retval = self.roster[hockeyID].stars if hockeyID in self.roster else None
+        if not isinstance(retval, int):
             retval = None
         return retval
     
     #-------------------------------------------------------------------------------    
-    def setStars(self, hockeyID, stars):
+    def setStars(self, hockeyID, stars, date='', reason=''):
         retval = True
         try:           
-            self.roster[hockeyID][self.R_STARS] = str(stars)
+            player = self.roster[hockeyID]
+            if player.stars != int(stars):
+                cumStars = player.cumStars if isinstance(player.cumStars, int) else 0
+                self.starLedger.record(hockeyID, "set", int(stars), cumStars, date, reason)
+                player.stars = int(stars)
+                self._journalStars(hockeyID)
         except:
             retval = False
+            self.starLedger.record(hockeyID, "error", 0, 0, date, f"could not set stars to {stars}")
             print()
             for i in range(5):
                 print("ERROR:", self.roster[hockeyID][self.R_FIRSTNAME], self.roster[hockeyID][self.R_LASTNAME], "DID NOT SET THEIR STAR TO", stars)
@@ -111,12 +212,38 @@ class CRoster:
         return retval
 
     #-------------------------------------------------------------------------------    
-    def incrStars(self, hockeyID):
-        try:           
-            self.roster[hockeyID][self.R_STARS] = str(int(self.roster[hockeyID][self.R_STARS]) + 1)
-            self.roster[hockeyID][self.R_CUMSTARS] = str(int(self.roster[hockeyID][self.R_CUMSTARS]) + 1)
-            retval = int(self.roster[hockeyID][self.R_STARS])
-        except:
+    def _changeStars(self, hockeyID, kind, stars, cumStars, date, reason):
+        """Add stars/cumStars (negative to take away) to the player's counts. Returns the new star count, or None if
+        the player isn't in the roster or their counts aren't numbers."""
+        player = self.roster.get(hockeyID)
+        if player is None or not isinstance(player.stars, int) or not isinstance(player.cumStars, int):
+            self.starLedger.record(hockeyID, "error", 0, 0, date, f"could not {kind} {stars} stars ({reason})")
+            return None
+        self.starLedger.record(hockeyID, kind, stars, cumStars, date, reason)
+        player.stars, player.cumStars = player.stars + stars, player.cumStars + cumStars
+        self._journalStars(hockeyID)
+        return player.stars
+
+    #-------------------------------------------------------------------------------    
+    def spendStars(self, hockeyID, count, date, reason):
+        """Use count stars (e.g. 20 for a free game). Returns the stars left, or None if they couldn't be taken."""
+        retval = self._changeStars(hockeyID, "spend", -count, 0, date, reason)
+        if retval is None:
+            print("ERROR 764:", hockeyID, "could not be charged", count, "stars for", reason)
+        return retval
+
+    #-------------------------------------------------------------------------------    
+    def creditStars(self, hockeyID, count, date, reason):
+        """Give back count stars (not counted as earned). Returns the new star count, or None if they couldn't be."""
+        retval = self._changeStars(hockeyID, "credit", count, 0, date, reason)
+        if retval is None:
+            print("ERROR 765:", hockeyID, "could not be credited", count, "stars for", reason)
+        return retval
+
+    #-------------------------------------------------------------------------------    
+    def incrStars(self, hockeyID, date='', reason='early bird'):
+        retval = self._changeStars(hockeyID, "earn", 1, 1, date, reason)
+        if retval is None:
             print()
             for i in range(5):
                 print("ERROR:", self.roster[hockeyID][self.R_FIRSTNAME], self.roster[hockeyID][self.R_LASTNAME], "DID NOT GET THEIR STAR !!!")
@@ -125,6 +252,11 @@ class CRoster:
             retval = -1
         return retval
 
+    #-------------------------------------------------------------------------------    
+    def verifyStars(self):
+        """Replay the star ledger and check it against the StarsCur/StarsTot columns"""
+        return self.starLedger.verify()
+
     #-------------------------------------------------------------------------------    
     def getMeetupName(self, hockeyID):
         retval = ""
@@ -139,14 +271,12 @@ class CRoster:
         return self.roster.get(hockeyID, [""])[self.R_EMAIL]
 
     #-------------------------------------------------------------------------------    
-    def getPlayers(self, partialPlayerName):
-        partialPlayerName = partialPlayerName.upper()
-        retval = [self.roster[player] for player in self.roster if self.roster[player][self.R_MEETUPNAME].upper().find(partialPlayerName) >= 0]               
-        if len(retval) == 0:
-            retval = [self.roster[player] for player in self.roster 
-                      if self.roster[player][self.R_FIRSTNAME].upper().find(partialPlayerName) >= 0 or 
-                         self.roster[player][self.R_LASTNAME].upper().find(partialPlayerName) >= 0]
-        return retval 
+    def getPlayers(self, partialPlayerName, limit=None):
+        """Return the players whose Meetup name, first/last name, email or phone matches, best match first.
+        Each word of partialPlayerName can be the start or any part of a word, or a near miss of one."""
+        if self.search is None:
+            self.search = CPlayerSearch(self.roster)
+        return self.search.search(partialPlayerName, limit)
 
     #-------------------------------------------------------------------------------    
     def printRoster(self):
@@ -163,7 +293,12 @@ class CRoster:
             playername = input("Enter some portion of the player name (or nothing to exit): ")
             if len(playername) == 0:
                 return None
-            players = self.getPlayers(playername)        
+            players = self.getPlayers(playername, limit=MAX_PLAYER_CHOICES + 1)
+            # a full Meetup name, first and last name or Hockey ID picks that player even if it starts other names too
+            exact = [player for player in players if playername.strip().upper() in 
+                     (player[self.R_MEETUPNAME].upper(), (player[self.R_FIRSTNAME] + " " + player[self.R_LASTNAME]).upper(), player[self.R_HOCKEYUSERID].upper())]
+            if len(exact) == 1:
+                players = exact
             if len(players) == 1:
                 ok = input("Did you mean " + players[0][self.R_HOCKEYUSERID] + " (" + players[0][self.R_FIRSTNAME] + " " + players[0][self.R_LASTNAME] + ")? (y/n) ")
                 if len(ok) == 0 or ok.upper()[0] != "Y":
@@ -173,31 +308,26 @@ class CRoster:
             elif len(players) == 0:
                 print("Sorry, we have no players that match your request")
             elif len(players) > 1:
-                print("There are multiple matches.  You'll need to be more specific.")
-                for player in players:
-                    print("         ", player[0])
+                print("There are multiple matches, best first.")
+                for idx, player in enumerate(players[:MAX_PLAYER_CHOICES]):
+                    print(f"   {idx + 1:2d}  {player[self.R_HOCKEYUSERID]:<16} {player[self.R_FIRSTNAME]} {player[self.R_LASTNAME]}")
+                if len(players) > MAX_PLAYER_CHOICES:
+                    print("       ... and more.  Be more specific to see them.")
+                choice = input("Enter the number of the player (or nothing to search again): ")
+                if choice.isdigit() and 1 <= int(choice) <= min(len(players), MAX_PLAYER_CHOICES):
+                    return players[int(choice) - 1]
         return None
 
     #-------------------------------------------------------------------------------    
-    def playHistory(self, playerRec):
+    def playHistory(self, playerRec, attendance=None):
+        """attendance is the session's CAttendance; without one, the attendance index is loaded (and updated) here"""
+        if attendance is None:
+            attendance = CAttendance.CAttendance()
         print()
         print("Play History for ", playerRec)
         print("-------------------------------------------------------------")
-
-        # get game history files
-        files = []
-        files = [filename for filename in os.listdir(os.path.join(self.path, "games")) if len(filename)==12 and filename.upper().startswith('20') and filename.upper().endswith('.XLS')]
-        files.sort()
-
-        # check each play date to see if player included on that day
-        for filename in files:
-            filepath = os.path.join(self.path, "games", filename)
-            with open(filepath, newline='') as csvfile:
-                rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
-                for row_number,row in enumerate(rows):
-                    if row_number > 0 and len(row) > 0:
-                        if row[1] == playerRec[self.R_HOCKEYUSERID] and len(row[1]) > 0:	    #SKPTODO hockeyuserid vs meetupuserid
-                            print(filename[0:8])    
+        for date in attendance.getPlayDates(playerRec[self.R_HOCKEYUSERID]):
+            print(date)
         print()
         return         
 
@@ -207,6 +337,7 @@ if __name__ == "__main__":
     roster = CRoster()
     roster.printRoster()
     roster.saveRoster()
+    roster.verifyStars()
 
     playerRec = roster.getPlayerName()
 
@@ -0,0 +1,97 @@
+import os
+import CPunchcards
+import CRoster
+import CEmail
+import CAttendance
+from CDatabase import CDatabase
+from CInfo import CInfo
+from CXref import CXref
+from utils import *
+
+#-------------------------------------------------------------------------------
+class CSession:
+    """The data files loaded for one menu action: info.json, roster.csv, punchcards.csv and meetup_roster.csv.
+
+    CGameDay, CEmail and CPunchcards all take a session and share its objects, so each file is read once per action
+    instead of once per object (or, for the email composers, once per email). Each piece is loaded on first use.
+    """
+    def __init__(self, info=None):
+        self.path = getHockeyPath()
+        self.info = info if info is not None else CInfo()
+        self._roster = None
+        self._punchcards = None
+        self._email = None
+        self._xref = None
+        self._database = None
+        self._attendance = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def attach(self, obj):
+        """Adopt a CPunchcards/CRoster/CEmail that was built before the session was asked for one"""
+        if isinstance(obj, CPunchcards.CPunchcards) and self._punchcards is None:
+            self._punchcards = obj
+        elif isinstance(obj, CRoster.CRoster) and self._roster is None:
+            self._roster = obj
+        elif isinstance(obj, CEmail.CEmail) and self._email is None:
+            self._email = obj
+
+    #-------------------------------------------------------------------------------
+    @property
+    def database(self):
+        """hockey.db, or None when the data is kept in the csv files (the default)"""
+        if self._database is None and self.info.getValue("storage_backend") == "sqlite":
+            self._database = CDatabase()
+        return self._database
+
+    #-------------------------------------------------------------------------------
+    @property
+    def roster(self):
+        if self._roster is None:
+            self._roster = CRoster.CRoster(info=self.info, database=self.database)
+        return self._roster
+
+    #-------------------------------------------------------------------------------
+    @property
+    def punchcards(self):
+        if self._punchcards is None:
+            CPunchcards.CPunchcards(session=self)
+        return self._punchcards
+
+    #-------------------------------------------------------------------------------
+    @property
+    def email(self):
+        if self._email is None:
+            CEmail.CEmail(session=self)
+        return self._email
+
+    #-------------------------------------------------------------------------------
+    @property
+    def attendance(self):
+        """Who played on which date, from the game files (see CAttendance)"""
+        if self._attendance is None:
+            self._attendance = CAttendance.CAttendance(session=self)
+        return self._attendance
+
+    #-------------------------------------------------------------------------------
+    @property
+    def xref(self):
+        """Meetup User ID <-> Hockey User ID cross reference (CXref), from meetup_roster.csv"""
+        if self._xref is None:
+            self.reloadXref()
+        return self._xref
+
+    #-------------------------------------------------------------------------------
+    def reloadXref(self):
+        self._xref = CXref(self.database)
+
+    #-------------------------------------------------------------------------------
+    def printFileLoads(self):
+        if self.info.getValue("show_file_loads"):
+            printFileLoadCounts()
@@ -0,0 +1,69 @@
+import os
+import pickle
+import CRecords
+from utils import *
+
+#-------------------------------------------------------------------------------
+class CSnapshot:
+    """Pickled copy of the rows parsed from one of the tab separated data files, saved as <file>.snapshot.
+
+    The snapshot records the size and modification time of the data file it was made from. If the data file has been
+    written since (by the program without a snapshot, or hand edited in Excel/LibreOffice) the snapshot is stale,
+    load() returns None and the caller parses the file as usual and saves a new snapshot.
+
+    Punchcard statuses and odd play dates are stored as codes into tables in CRecords, so the tables are saved with the
+    rows and a snapshot whose codes don't line up with this run's tables is treated as stale too.
+    """
+    VERSION = 3         # bump when the pickled record layout changes
+
+    def __init__(self, sourceFile):
+        self.path = getHockeyPath()
+        self.sourceFilename = os.path.join(self.path, sourceFile)
+        self.snapshotFilename = self.sourceFilename + ".snapshot"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def _sourceSignature(self):
+        stat = os.stat(self.sourceFilename)
+        return [self.VERSION, stat.st_size, stat.st_mtime_ns]
+
+    #-------------------------------------------------------------------------------
+    def load(self):
+        """Return the rows saved for the data file, or None if there is no up to date snapshot"""
+        if not os.path.exists(self.snapshotFilename) or not os.path.exists(self.sourceFilename):
+            return None
+        try:
+            with open(self.snapshotFilename, 'rb') as file:
+                snapshot = pickle.load(file)
+        except Exception:
+            return None
+        if snapshot.get("source") != self._sourceSignature():
+            return None
+        for status in snapshot["statuses"]:
+            CRecords.encodeStatus(status)
+        for date in snapshot["oddDates"]:
+            CRecords.encodeDate(date)
+        if CRecords.STATUS_NAMES[:len(snapshot["statuses"])] != snapshot["statuses"] or \
+           CRecords.ODD_DATES[:len(snapshot["oddDates"])] != snapshot["oddDates"]:
+            return None
+        countFileLoad(os.path.basename(self.snapshotFilename))
+        return snapshot["rows"]
+
+    #-------------------------------------------------------------------------------
+    def save(self, rows):
+        """Save the rows just read from (or written to) the data file"""
+        snapshot = {"source": self._sourceSignature(), "statuses": list(CRecords.STATUS_NAMES),
+                    "oddDates": list(CRecords.ODD_DATES), "rows": rows}
+        try:
+            with open(self.snapshotFilename + ".tmp", 'wb') as file:
+                pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(self.snapshotFilename + ".tmp", self.snapshotFilename)
+        except OSError as e:
+            # only a speed-up, so carry on without it
+            print(f"WARNING 721: Could not save {os.path.basename(self.snapshotFilename)}: {e}")
@@ -0,0 +1,139 @@
+import os
+import json
+from datetime import datetime
+from utils import *
+
+#-------------------------------------------------------------------------------
+class CStarLedger:
+    """Append-only record of every change to a player's stars, in stars.ledger (one JSON event per line).
+
+    Each event has the play date it's for, when it was recorded, the Hockey User ID, its kind and reason, and the
+    change to the current ("stars") and lifetime ("cumStars") counts:
+        earn    early bird star from gameday processing (+1/+1)
+        spend   stars used for a free (or half) game
+        credit  stars given back, e.g. the 10 stars credited when a half game is charged a full punch
+        error   a change that failed (nothing changed, but the attempt is on record)
+        set     CRoster.setStars() (the new counts, not a change)
+        open    the counts the roster had when the ledger was started
+
+    The ledger is never compacted, so it's the audit trail for the StarsCur/StarsTot columns in roster.csv. balances
+    replays it (once, on first use) and is then kept up to date as events are recorded, so balance() is a lookup.
+    Like the roster, events are queued and written when the roster is saved, and dropped if a CUnitOfWork rolls back.
+    """
+    def __init__(self, roster):
+        self.path = getHockeyPath()
+        self.ledgerFilename = os.path.join(self.path, "stars.ledger")
+        self.roster = roster
+        self.pending = []
+        self._balances = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def events(self):
+        """All events saved so far, oldest first, followed by any not yet written"""
+        records = []
+        if os.path.exists(self.ledgerFilename):
+            countFileLoad("stars.ledger")
+            with open(self.ledgerFilename, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # a crash while appending can leave a partial last line, which was never acknowledged
+                        print("WARNING 761: Ignoring incomplete record at the end of stars.ledger")
+                        break
+        return records + self.pending
+
+    #-------------------------------------------------------------------------------
+    @property
+    def balances(self):
+        """Hockey User ID -> [stars, cumStars], replayed from the ledger"""
+        if self._balances is None:
+            self._balances = {}
+            for event in self.events():
+                self._apply(event)
+        return self._balances
+
+    #-------------------------------------------------------------------------------
+    def _apply(self, event):
+        if event["kind"] in ("open", "set"):
+            self._balances[event["id"]] = [event["stars"], event["cumStars"]]
+        elif event["kind"] != "error":
+            balance = self._balances.setdefault(event["id"], [0, 0])
+            balance[0] += event["stars"]
+            balance[1] += event["cumStars"]
+
+    #-------------------------------------------------------------------------------
+    def balance(self, hockeyID):
+        return self.balances.get(hockeyID, [0, 0])[0]
+
+    #-------------------------------------------------------------------------------
+    def _opened(self):
+        return os.path.exists(self.ledgerFilename) or len(self.pending) > 0
+
+    #-------------------------------------------------------------------------------
+    def record(self, hockeyID, kind, stars, cumStars, date, reason):
+        """Record a change. Call it before the roster columns are changed: the first event opens the ledger with the
+        roster's balances as they are at that point."""
+        if not self._opened():
+            now = datetime.now().isoformat(timespec='seconds')
+            for player in self.roster.roster.values():
+                if isinstance(player.stars, int) and isinstance(player.cumStars, int) and (player.stars or player.cumStars):
+                    self._queue({"time": now, "date": "", "id": player.hockeyID, "kind": "open",
+                                 "stars": player.stars, "cumStars": player.cumStars, "reason": "opening balance"})
+        self._queue({"time": datetime.now().isoformat(timespec='seconds'), "date": date, "id": hockeyID, "kind": kind,
+                     "stars": stars, "cumStars": cumStars, "reason": reason})
+
+    #-------------------------------------------------------------------------------
+    def _queue(self, event):
+        self.pending.append(event)
+        if self._balances is not None:
+            self._apply(event)
+
+    #-------------------------------------------------------------------------------
+    def flush(self):
+        """Append the queued events to stars.ledger and fsync it"""
+        if len(self.pending) == 0:
+            return
+        with open(self.ledgerFilename, 'a', encoding='utf-8') as file:
+            for event in self.pending:
+                file.write(json.dumps(event) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.pending = []
+
+    #-------------------------------------------------------------------------------
+    def discard(self):
+        """Drop events that were queued but not yet written"""
+        self.pending = []
+        self._balances = None
+
+    #-------------------------------------------------------------------------------
+    def history(self, hockeyID='', startdate='', enddate=''):
+        """Events for one player (or everyone) with a play date between startdate and enddate (YYYYMMDD, inclusive)"""
+        return [event for event in self.events() if (len(hockeyID) == 0 or event["id"] == hockeyID) and
+                (len(startdate) == 0 or event["date"] >= startdate) and (len(enddate) == 0 or event["date"] <= enddate)]
+
+    #-------------------------------------------------------------------------------
+    def verify(self):
+        """Compare the replayed balances with the StarsCur/StarsTot columns of the roster. Returns the number of
+        players that don't match."""
+        if not self._opened():
+            print("INFO 763: No star changes have been recorded yet")
+            return 0
+        mismatches = 0
+        for hockeyID, player in self.roster.roster.items():
+            expected = self.balances.get(hockeyID, [0, 0])
+            if [player.stars, player.cumStars] != expected:
+                mismatches += 1
+                print(f"ERROR 762: {hockeyID} {player.meetupName} has stars {player.stars}/{player.cumStars} in the roster, "
+                      f"but {expected[0]}/{expected[1]} by the star ledger")
+        if mismatches == 0:
+            print(f"INFO 763: Star ledger agrees with the roster for all {len(self.roster.roster)} players")
+        return mismatches
@@ -0,0 +1,79 @@
+#-------------------------------------------------------------------------------
+class CUnitOfWork:
+    """Collect all punchcard and roster changes made during one session and commit them together.
+
+    Use it as a context manager around an interactive (or scripted) session:
+
+        with CUnitOfWork(punchcards, roster, email):
+            ...
+
+    While the session is open, CPunchcards._savePunchcards() and CRoster.saveRoster() only validate in memory, and
+    emails sent through email (a CEmail) are queued. When the block ends normally, each file is written once and then
+    the emails go out. If an exception escapes the block, the in-memory punchcards and roster are put back the way they
+    were when the session started, nothing is written and the queued emails are dropped, so no one is told about a
+    charge that was never saved.
+    """
+    def __init__(self, punchcards=None, roster=None, email=None):
+        self.punchcards = punchcards
+        self.roster = roster
+        self.email = email
+        self.punchcardSnapshot = None
+        self.rosterSnapshot = None
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            unsent = self.rollback()
+            print(f"\nERROR 715: {exc_type.__name__} during the session. All of its punchcard and roster changes were rolled back.")
+            if self.email is not None:
+                print(f"           Its {unsent} emails were not sent.")
+            else:
+                print("           Any emails already sent for this session will need to be corrected by hand.")
+        return False
+
+    #-------------------------------------------------------------------------------
+    def begin(self):
+        if self.punchcards is not None:
+            self.punchcardSnapshot = [row.copy() for row in self.punchcards.punchcards]
+            self.punchcards.deferSave = True
+        if self.roster is not None:
+            self.rosterSnapshot = ({hockeyID: row.copy() for hockeyID, row in self.roster.roster.items()}, self.roster.modified)
+            self.roster.deferSave = True
+        if self.email is not None:
+            self.email.holdEmails()
+
+    #-------------------------------------------------------------------------------
+    def commit(self):
+        if self.punchcards is not None:
+            self.punchcards.deferSave = False
+            self.punchcards._savePunchcards()
+        if self.roster is not None:
+            self.roster.deferSave = False
+            self.roster.saveRoster()
+        if self.email is not None:
+            self.email.releaseEmails()
+
+    #-------------------------------------------------------------------------------
+    def rollback(self):
+        if self.punchcards is not None:
+            self.punchcards.deferSave = False
+            self.punchcards.punchcards = self.punchcardSnapshot
+            self.punchcards._buildIndexes()
+            if self.punchcards.journal is not None:
+                self.punchcards.journal.discard()
+        if self.roster is not None:
+            self.roster.deferSave = False
+            self.roster.roster, self.roster.modified = self.rosterSnapshot
+            self.roster._buildOrder()
+            self.roster.search = None
+            self.roster.starLedger.discard()
+            if self.roster.journal is not None:
+                self.roster.journal.discard()
+        if self.email is not None:
+            return self.email.discardEmails()
+        return 0
@@ -0,0 +1,150 @@
+import os
+import sys
+import csv
+from CRecords import XREF_FILE_HEADER
+from CSnapshot import CSnapshot
+from utils import *
+
+X_MEETUPNAME = 0
+X_MEETUPUSERID = 1
+X_HOCKEYUSERID = 2
+
+#-------------------------------------------------------------------------------
+def normalizeMeetupID(meetupID):
+    """Meetup User IDs appear both bare ("123456") and as "user 123456", and LibreOffice/Excel like to turn the latter
+    into "User 123456". All of them are the same player, so they're looked up by the bare number."""
+    meetupID = meetupID.strip()
+    if meetupID[:5].lower() == "user ":
+        meetupID = meetupID[5:].strip()
+    return meetupID
+
+#-------------------------------------------------------------------------------
+class CXref:
+    """Meetup User ID <-> Hockey User ID cross reference, from meetup_roster.csv (or hockey.db with the sqlite backend).
+
+    Lookups use normalizeMeetupID(), so the "user "/"User " prefix doesn't matter. New mappings are appended to the
+    end of meetup_roster.csv instead of rewriting it; compact() puts the file back in Meetup name order.
+
+    rows: [Meetup name, Meetup User ID, Hockey User ID, any other columns] as in the file
+    hockeyIDs: normalized Meetup User ID -> Hockey User ID
+    meetupIDs: Hockey User ID -> [normalized Meetup User IDs]
+    """
+    def __init__(self, database=None):
+        self.path = getHockeyPath()
+        self.filepath = os.path.join(self.path, "meetup_roster.csv")
+        self.database = database    # hockey.db, if info.json selects the sqlite storage backend
+        self.rows = []
+        self.hockeyIDs = {}
+        self.meetupIDs = {}
+        self._loadXref()
+        for row in self.rows:
+            if len(row) > X_HOCKEYUSERID:
+                self._indexRow(row)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # close, deallocate, etc
+        pass
+
+    #-------------------------------------------------------------------------------
+    def _loadXref(self):
+        if self.database is not None:
+            self.rows = self.database.loadXref()
+            return
+
+        snapshot = CSnapshot("meetup_roster.csv")
+        self.rows = snapshot.load()
+        if self.rows is not None:
+            return
+
+        self.rows = []
+        try:
+            countFileLoad("meetup_roster.csv")
+            with open(self.filepath, newline='') as csvfile:
+                rows = csv.reader(csvfile, delimiter='\t', quotechar='"')
+                next(rows)
+                for row in rows:
+                    if len(row) > 0:
+                        self.rows.append(row)
+        except Exception as e:
+            print(f"Error reading xref file: {e}")
+            return
+        snapshot.save(self.rows)
+
+    #-------------------------------------------------------------------------------
+    def _indexRow(self, row):
+        meetupID, hockeyID = normalizeMeetupID(row[X_MEETUPUSERID]), row[X_HOCKEYUSERID]
+        previous = self.hockeyIDs.get(meetupID)
+        if previous is not None and previous != hockeyID:
+            print(f"WARNING 791: Meetup User ID {meetupID} is listed for both {previous} and {hockeyID} in meetup_roster.csv. Using {hockeyID}.")
+            self.meetupIDs[previous].remove(meetupID)
+        self.hockeyIDs[meetupID] = hockeyID
+        if meetupID not in self.meetupIDs.setdefault(hockeyID, []):
+            self.meetupIDs[hockeyID].append(meetupID)
+
+    #-------------------------------------------------------------------------------
+    def __contains__(self, meetupID):
+        return normalizeMeetupID(meetupID) in self.hockeyIDs
+
+    #-------------------------------------------------------------------------------
+    def getHockeyID(self, meetupID, default=None):
+        """Hockey User ID for the Meetup User ID, or default (the Meetup User ID itself if not given) if there's none"""
+        return self.hockeyIDs.get(normalizeMeetupID(meetupID), meetupID if default is None else default)
+
+    #-------------------------------------------------------------------------------
+    def getMeetupIDs(self, hockeyID):
+        """All the (normalized) Meetup User IDs the player has used"""
+        return self.meetupIDs.get(hockeyID, [])
+
+    #-------------------------------------------------------------------------------
+    def add(self, hockeyID, meetupName, meetupID):
+        """Add a mapping. It's appended to meetup_roster.csv (or inserted into hockey.db) without rewriting the rest."""
+        row = [meetupName, meetupID, hockeyID]
+        if self.database is not None:
+            self.database.addXref(hockeyID, meetupName, meetupID)
+        else:
+            with open(self.filepath, 'rb') as file:
+                file.seek(max(os.path.getsize(self.filepath) - 1, 0))
+                endsWithNewline = file.read(1) in (b"\n", b"")
+            with open(self.filepath, 'a', newline='', encoding='utf-8') as csvfile:
+                if not endsWithNewline:
+                    csvfile.write("\r\n")     # hand edited and saved without a final line break
+                writer = csv.writer(csvfile, delimiter='\t', quotechar='"', quoting=csv.QUOTE_ALL)
+                writer.writerow(row)
+        self.rows.append(row)
+        self._indexRow(row)
+        if self.database is None:
+            CSnapshot("meetup_roster.csv").save(self.rows)
+
+    #-------------------------------------------------------------------------------
+    def isSorted(self):
+        names = [row[X_MEETUPNAME].upper() for row in self.rows]
+        return all(names[idx] <= names[idx + 1] for idx in range(len(names) - 1))
+
+    #-------------------------------------------------------------------------------
+    def compact(self):
+        """Rewrite meetup_roster.csv in Meetup name order (appended rows are at the end until then)"""
+        if self.database is not None:
+            return
+        self.rows.sort(key=lambda row: row[X_MEETUPNAME].upper())
+        # keep the file's own header, which names any extra columns
+        with open(self.filepath, newline='') as csvfile:
+            header = next(csv.reader(csvfile, delimiter='\t', quotechar='"'), None) or XREF_FILE_HEADER
+        with open(self.filepath + ".tmp", 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile, delimiter='\t', quotechar='"', quoting=csv.QUOTE_ALL)
+            writer.writerow(header)
+            writer.writerows(self.rows)
+        replaceFileAtomic(self.filepath + ".tmp", self.filepath)
+        CSnapshot("meetup_roster.csv").save(self.rows)
+
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    # python CXref.py compact
+    xref = CXref()
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        xref.compact()
+    print(len(xref.rows), "Meetup IDs for", len(xref.meetupIDs), "players;", "sorted" if xref.isSorted() else "not sorted")
+    print("all done")
@@ -0,0 +1,44 @@
+# check that CPunchcards.findDuplicateCharges() reports double charges, including the ones involving a card's alt
+# payer, and doesn't report a card's owner and alt playing the same game. Uses made up punchcards, not the data files.
+#   python checkDuplicateCharges.py          (exit code 0 = ok, 1 = failed)
+import sys
+from CPunchcards import findDuplicateCharges
+from CRecords import CPunchcardRecord
+
+DATE = "20250105"
+
+#-------------------------------------------------------------------------------
+def card(hockeyID, altID, *dates):
+    row = [hockeyID, "Player " + hockeyID, altID, "Player " + altID if len(altID) > 0 else "", "curr", "20250101"]
+    return CPunchcardRecord.fromRow(row + list(dates) + [''] * (CPunchcardRecord.SLOT_COUNT - len(dates)))
+
+# (name, punchcards, players at the game, players who should be reported)
+CASES = [
+    ("owner and alt both played, two punches on the card", [card("P003", "P004", DATE, DATE)], {"P003", "P004"}, []),
+    ("alt charged on their own card and on the card they're alt on",
+     [card("P003", "P004", DATE), card("P004", "", DATE)], {"P004"}, ["P004"]),
+    ("owner on their card, alt on their own card", [card("P003", "P004", DATE), card("P004", "", DATE)], {"P003", "P004"}, []),
+    ("owner charged twice on their card, alt didn't play", [card("P003", "P004", DATE, DATE)], {"P003"}, ["P003"]),
+    ("charged twice on a card with no alt", [card("P001", "", DATE, DATE)], {"P001"}, ["P001"]),
+    ("charged on two of their own cards", [card("P001", "", DATE), card("P001", "", DATE)], {"P001"}, ["P001"]),
+    ("three punches on a card with an alt", [card("P003", "P004", DATE, DATE, DATE)], {"P003", "P004"}, ["P003"]),
+    ("shared punchcard", [card("P009", "", DATE, DATE)], {"P009"}, []),
+]
+
+#-------------------------------------------------------------------------------
+def checkDuplicateCharges():
+    ok = True
+    for name, cards, attendees, expected in CASES:
+        duplicates = findDuplicateCharges([("check", cards)], int(DATE), int(DATE), {"P009"}, lambda date: attendees)
+        reported = [player for player, date, occurrences in duplicates]
+        if reported != expected:
+            print(f"ERROR 787: {name}: reported {reported}, expected {expected}")
+            ok = False
+    if ok:
+        print(f"INFO 788: findDuplicateCharges passed all {len(CASES)} cases")
+    return ok
+
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    sys.exit(0 if checkDuplicateCharges() else 1)
@@ -0,0 +1,58 @@
+# check that the menu starts quickly: importing CMenu must not pull in the slow modules (they're imported by the menu
+# actions that use them) and must fit in info.json's startup_budget_ms.
+#   python checkStartup.py          (exit code 0 = ok, 1 = failed)
+import os
+import sys
+import json
+import subprocess
+from CInfo import CInfo
+
+# imported by the menu actions that need them, never at startup
+HEAVY_MODULES = ["numpy", "bs4", "psutil", "smtplib", "webbrowser"]
+RUNS = 5        # the fastest run is used, so one slow run (e.g. writing the .pyc files) doesn't fail the check
+
+# run in a fresh interpreter, so nothing this script has imported counts
+CHILD = f"""
+import sys, time, json
+start = time.perf_counter()
+import CMenu
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": elapsed, "loaded": [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+#-------------------------------------------------------------------------------
+def importCMenu():
+    """Import CMenu in a new Python process. Returns (milliseconds, heavy modules that were loaded)."""
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        print("ERROR 783: Could not import CMenu")
+        print(result.stderr)
+        sys.exit(1)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["ms"], report["loaded"]
+
+#-------------------------------------------------------------------------------
+def checkStartup():
+    budget = CInfo().getValue("startup_budget_ms") or 250
+    ok = True
+    elapsed = None
+    for run in range(RUNS):
+        ms, loaded = importCMenu()
+        if len(loaded) > 0:
+            print(f"ERROR 784: Importing CMenu loaded {', '.join(loaded)}. Import them in the menu action that uses them.")
+            ok = False
+            break
+        elapsed = ms if elapsed is None else min(elapsed, ms)
+    if ok and elapsed > budget:
+        print(f"ERROR 785: Importing CMenu took {elapsed:.0f} ms, over the budget of {budget} ms.")
+        print("           Run 'python -X importtime CMenu.py' to see which imports are slow.")
+        ok = False
+    if ok:
+        print(f"INFO 786: Importing CMenu took {elapsed:.0f} ms (budget {budget} ms), none of {', '.join(HEAVY_MODULES)} loaded")
+    return ok
+
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    sys.exit(0 if checkStartup() else 1)
@@ -1,10 +1,7 @@
 # read players signed up for next hockey game
+# The browser, web and html parsing modules are imported by the functions that download from Meetup, so the menu
+# doesn't pay for them at startup.
 import os
-import subprocess
-import urllib.request, urllib.error, urllib.parse
-from threading import Thread
-import bs4
-import webbrowser
 import re  
 import time
 import shutil
@@ -20,7 +17,16 @@ if os.name == 'nt':
     chrome_path = CHROME_PATH_WINDOWS
 else:    
     chrome_path = CHROME_PATH_MAC
-webbrowser.register('chrome', None, webbrowser.BackgroundBrowser(chrome_path))
+
+#-------------------------------------------------------------------------------
+def getChromeBrowser():
+    # registered on first use rather than when the module is imported
+    import webbrowser
+    try:
+        return webbrowser.get('chrome')
+    except webbrowser.Error:
+        webbrowser.register('chrome', None, webbrowser.BackgroundBrowser(chrome_path))
+        return webbrowser.get('chrome')
 
 #-------------------------------------------------------------------------------
 def downloadMeetupAttendeesThread(url):
@@ -28,7 +34,7 @@ def downloadMeetupAttendeesThread(url):
         start_chrome()
 
     print("Starting download", url)
-    webbrowser.get('chrome').open(url)
+    getChromeBrowser().open(url)
     timeout = 30
     while getDownloadFileCount() != 1 and timeout > 0:
         timeout -= 1
@@ -38,6 +44,7 @@ def downloadMeetupAttendeesThread(url):
 
 #-------------------------------------------------------------------------------
 def start_chrome():
+    import subprocess
     try:
         subprocess.Popen([chrome_path])
         time.sleep(5)  # wait for Chrome to open
@@ -142,6 +149,9 @@ def getEventNumber(pagesource):
 
 #-------------------------------------------------------------------------------
 def downloadAttendees(urlSuffix="?type=upcoming"):
+    import urllib.request
+    import bs4
+    from threading import Thread
 
     deleteAllDownloads()
 
@@ -1,15 +1,33 @@
 import os
-import psutil
+
+# number of times each data file has been read from disk during this run (see countFileLoad)
+FILE_LOADS = {}
+
+#-------------------------------------------------------------------------------   
+def countFileLoad(filename):
+    FILE_LOADS[filename] = FILE_LOADS.get(filename, 0) + 1
+
+#-------------------------------------------------------------------------------   
+def printFileLoadCounts():
+    print("File loads this run:", ", ".join(f"{name} x{count}" for name, count in sorted(FILE_LOADS.items())))
 
 #-------------------------------------------------------------------------------   
 def isChromeRunning():
     # Adjust Chrome process name for macOS compatibility
     chrome_process_name = 'chrome.exe' if os.name == 'nt' else 'Google Chrome'
+    import psutil       # only needed to download from Meetup, so not imported at startup
     for proc in psutil.process_iter(['pid', 'name']):
         if proc.info['name'] == chrome_process_name:
             return True
     return False
 
+#-------------------------------------------------------------------------------        
+def replaceFileAtomic(tempFilepath, filepath):
+    # the new contents were written to tempFilepath; make sure they're on disk, then swap them in with a single rename
+    with open(tempFilepath, 'rb+') as file:
+        os.fsync(file.fileno())
+    os.replace(tempFilepath, filepath)
+
 #-------------------------------------------------------------------------------        
 def getHockeyPath():
     return os.path.abspath(os.path.dirname(__file__))